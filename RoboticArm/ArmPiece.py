@@ -1,3 +1,5 @@
+import numpy as np
+import math
 from RoboticArm.colors import *
 from lib.Math.Vector import Vector2 as V
 
@@ -42,16 +44,79 @@ class ArmPiece:
     def update_theta(self, theta):
         self.theta = theta
 
+    def get_parameters(self):
+        """
+        Geometry of the piece (everything but its pose), as a flat list
+        """
+        return [self.size.x, self.size.y, self.pivot_offset.x, self.pivot_offset.y, self.attach_offset.x, self.attach_offset.y]
+
     def arm_frame_to_global(self, point):
         return self.pivot_position + point.rotate_by_angle(self.theta)
     
-    def get_arm_points(self):
+    def get_local_points(self):
+        """
+        Returns the four corners of the piece in the arm frame, relative to the pivot
+        """
         ref_pivot = V(-self.pivot_offset.x,self.pivot_offset.y)
-        A = self.arm_frame_to_global(ref_pivot)
-        B = self.arm_frame_to_global(self.size - self.pivot_offset)
-        C = self.arm_frame_to_global(V(self.size.x, 0) - self.pivot_offset)
-        D = self.arm_frame_to_global(-self.pivot_offset)
-        return [A, B, C, D]
+        return [ref_pivot, self.size - self.pivot_offset, V(self.size.x, 0) - self.pivot_offset, -self.pivot_offset]
+
+    def get_radius(self):
+        """
+        Distance from the pivot to the farthest point of the piece: no point moves more than radius * |dtheta| when the piece turns
+        """
+        return max(p.mag() for p in self.get_local_points())
+
+    def get_reach(self):
+        """
+        Distance from the pivot to the attach point
+        """
+        return (self.attach_offset - self.pivot_offset).mag()
+
+    def get_arm_points(self):
+        # same as arm_frame_to_global on each point, with a single cos / sin
+        c = math.cos(self.theta)
+        s = math.sin(self.theta)
+        x0, y0 = self.pivot_position.x, self.pivot_position.y
+        return [V(x0 + (c * p.x - s * p.y), y0 + (s * p.x + c * p.y)) for p in self.get_local_points()]
+
+    def get_local_points_array(self):
+        """
+        The four corners (get_local_points) followed by the attach point, relative to the pivot, as np.array (5, 2)
+        """
+        return np.array([[p.x, p.y] for p in self.get_local_points() + [self.attach_offset - self.pivot_offset]], dtype=float)
+
+    @staticmethod
+    def frame_to_global_array(pivot_positions, thetas, local_points):
+        """
+        Vectorized version of arm_frame_to_global, for many poses at once
+
+        Arguments:
+            pivot_positions: np.array (..., 2) -> pivot position of each pose
+            thetas: np.array (...) -> angle of each pose
+            local_points: np.array (K, 2) -> points in the arm frame
+        Returns:
+            np.array (..., K, 2) of the points in the global frame
+        """
+        c = np.cos(thetas)[..., None]
+        s = np.sin(thetas)[..., None]
+        x = local_points[:, 0]
+        y = local_points[:, 1]
+
+        out = np.empty(np.shape(thetas) + local_points.shape)
+        out[..., 0] = np.asarray(pivot_positions)[..., None, 0] + (c * x - s * y)
+        out[..., 1] = np.asarray(pivot_positions)[..., None, 1] + (s * x + c * y)
+        return out
+
+    def get_points_array(self, pivot_positions, thetas):
+        """
+        Corners and attach point of the piece for many poses, in a single pass
+
+        Returns:
+            np.array (..., 4, 2) -> corners, in the order of get_arm_points
+            np.array (..., 2) -> attach positions
+        """
+        points = self.frame_to_global_array(pivot_positions, thetas, self.get_local_points_array())
+        return points[..., :4, :], points[..., 4, :]
     
     def get_arm_triangles(self):
         [A, B, C, D] = self.get_arm_points()
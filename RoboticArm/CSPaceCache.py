@@ -0,0 +1,119 @@
+import numpy as np
+import hashlib
+import os
+from pathlib import Path
+
+from RoboticArm.CSPaceData import CSPaceData
+
+
+class CSPaceCache:
+    """
+    Disk cache of C-spaces, content-addressed: the key is a hash of the arm geometry,
+    the obstacle triangles and the sampling ranges, so the same scene never gets computed twice.
+    The least recently used files are evicted once the directory exceeds max_size bytes.
+    """
+    VERSION = b"cspace-cache-3" # change it when the C-space computation changes
+    EXTENSION = ".cspace"
+
+    def __init__(self, directory, max_size=256 * 2**20):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(arm, obstacle_triangles, theta1_range, theta2_range, num_samples, self_collision=False):
+        h = hashlib.sha256(CSPaceCache.VERSION)
+        h.update(np.asarray(arm.get_parameters(), dtype='<f8').tobytes())
+        h.update(np.asarray(arm.get_angles()[2:], dtype='<f8').tobytes()) # the C-space is the slice of the other joints
+
+        triangles = np.ascontiguousarray(obstacle_triangles, dtype='<f8')
+        h.update(np.asarray(triangles.shape, dtype='<i8').tobytes())
+        h.update(triangles.tobytes())
+
+        h.update(np.asarray([*theta1_range, *theta2_range], dtype='<f8').tobytes())
+        h.update(np.asarray([num_samples], dtype='<i8').tobytes())
+        if self_collision:
+            h.update(b"self-collision")
+        return h.hexdigest()
+
+    @staticmethod
+    def make_data_key(data: CSPaceData):
+        """
+        Key of the maps derived from a C-space (the clearance map), a hash of its ranges and occupancy
+        """
+        h = hashlib.sha256(CSPaceCache.VERSION)
+        h.update(np.asarray([data.theta_1_min, data.theta_1_max, data.theta_2_min, data.theta_2_max], dtype='<f8').tobytes())
+        h.update(np.asarray([data.theta_1_num_samples, data.theta_2_num_samples], dtype='<i8').tobytes())
+        h.update(np.ascontiguousarray(data.data.packed).tobytes())
+        return h.hexdigest()
+
+    def path(self, key, name=None):
+        if name is not None:
+            return self.directory / f"{key}.{name}.npy"
+        return self.directory / (key + self.EXTENSION)
+
+    def get(self, key):
+        """
+        Returns the cached CSPaceData, or None on a cache miss
+        """
+        path = self.path(key)
+        try:
+            data = CSPaceData.load(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        os.utime(path) # marks the entry as recently used
+        return data
+
+    def put(self, key, data: CSPaceData):
+        path = self.path(key)
+        tmp_path = path.with_suffix(".tmp")
+        data.save(tmp_path)
+        os.replace(tmp_path, path) # readers never see a partially written file
+        self.evict()
+
+    def get_array(self, key, name):
+        path = self.path(key, name)
+        try:
+            array = np.load(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        os.utime(path)
+        return array
+
+    def put_array(self, key, name, array):
+        path = self.path(key, name)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'wb') as file:
+            np.save(file, array)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def get_clearance_map(self, data: CSPaceData):
+        """
+        Returns data.clearance_map(), computed only when it is not cached yet
+        """
+        key = self.make_data_key(data)
+        clearance = self.get_array(key, "clearance")
+        if clearance is None:
+            clearance = data.clearance_map()
+            self.put_array(key, "clearance", clearance)
+        return clearance
+
+    def entries(self):
+        return list(self.directory.glob("*" + self.EXTENSION)) + list(self.directory.glob("*.npy"))
+
+    def size(self):
+        return sum(path.stat().st_size for path in self.entries())
+
+    def evict(self):
+        entries = sorted(((path.stat().st_mtime, path.stat().st_size, path) for path in self.entries()), key=lambda e: e[0])
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        for path in self.entries():
+            path.unlink(missing_ok=True)
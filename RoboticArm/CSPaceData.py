@@ -0,0 +1,187 @@
+import numpy as np
+import struct
+
+from dataclasses import dataclass
+
+from RoboticArm.utils.packed_grid import PackedBoolGrid
+from RoboticArm.utils.distance_transform import euclidean_distance_transform
+
+
+def is_full_turn(m, M):
+    return bool(np.isclose(M - m, 2 * np.pi))
+
+def sample_angles(m, M, N):
+    """
+    N samples of [m, M]. When the range is a full turn, M is the same angle as m and is not sampled,
+    so that the seam is not duplicated
+    """
+    return np.linspace(m, M, N, endpoint=not is_full_turn(m, M))
+
+
+@dataclass
+class CSPaceData:
+    theta_1_min: float
+    theta_1_max: float
+    theta_1_num_samples: int
+    theta_2_min: float
+    theta_2_max: float
+    theta_2_num_samples: int
+
+    data: PackedBoolGrid # data[i, j] is True when the arm collides at (theta1_i, theta2_j)
+
+    # On-disk format: a fixed size header followed by the packed rows
+    #   magic (8 bytes), theta_1_min, theta_1_max (float64), theta_1_num_samples (int64),
+    #   theta_2_min, theta_2_max (float64), theta_2_num_samples (int64), padding up to HEADER_SIZE
+    MAGIC = b"CSPACE2\0"
+    HEADER_FORMAT = "<8sddqddq"
+    HEADER_SIZE = 64
+
+    NEIGHBOUR_OFFSETS_4 = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+    NEIGHBOUR_OFFSETS_8 = NEIGHBOUR_OFFSETS_4 + [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+    @staticmethod
+    def empty(theta1_range, theta2_range, num_samples):
+        m1, M1 = theta1_range
+        m2, M2 = theta2_range
+        N = num_samples
+        return CSPaceData(
+            m1, M1, N,
+            m2, M2, N,
+            PackedBoolGrid((N, N)))
+
+    @staticmethod
+    def from_array(theta1_range, theta2_range, array):
+        m1, M1 = theta1_range
+        m2, M2 = theta2_range
+        N1, N2 = np.shape(array)
+        return CSPaceData(
+            m1, M1, N1,
+            m2, M2, N2,
+            PackedBoolGrid.from_array(array))
+
+    def axis_range(self, axis):
+        if axis == 0:
+            return self.theta_1_min, self.theta_1_max, self.theta_1_num_samples
+        return self.theta_2_min, self.theta_2_max, self.theta_2_num_samples
+
+    def periodic(self, axis):
+        """
+        True when the axis covers a full turn: the grid then wraps around along it
+        """
+        m, M, N = self.axis_range(axis)
+        return is_full_turn(m, M)
+
+    def samples(self, axis):
+        return sample_angles(*self.axis_range(axis))
+
+    def spacing(self, axis):
+        m, M, N = self.axis_range(axis)
+        if self.periodic(axis):
+            return (M - m) / N
+        return (M - m) / (N - 1) if N > 1 else 1.
+
+    def axis_period(self, axis):
+        """
+        Number of samples along the axis when it wraps around, None otherwise
+        """
+        return self.axis_range(axis)[2] if self.periodic(axis) else None
+
+    @property
+    def shape(self):
+        return (self.theta_1_num_samples, self.theta_2_num_samples)
+
+    def wrap(self, i, j):
+        """
+        Brings (i, j) back in the grid along the periodic axes, returns None when it is outside along another axis
+        """
+        N1, N2 = self.shape
+        if self.periodic(0):
+            i %= N1
+        if self.periodic(1):
+            j %= N2
+        if 0 <= i < N1 and 0 <= j < N2:
+            return i, j
+        return None
+
+    def neighbours(self, i, j, diagonals=True):
+        """
+        Cells next to (i, j), across the seam of the periodic axes
+        """
+        out = []
+        for di, dj in (self.NEIGHBOUR_OFFSETS_8 if diagonals else self.NEIGHBOUR_OFFSETS_4):
+            cell = self.wrap(i + di, j + dj)
+            if cell is not None and cell not in out:
+                out.append(cell)
+        return out
+
+    def index_of(self, theta1, theta2):
+        """
+        Closest cell of the configuration (theta1, theta2), angles outside of the periodic ranges being wrapped.
+        Returns None when it is outside of a non periodic range
+        """
+        indices = []
+        for axis, theta in ((0, theta1), (1, theta2)):
+            m, M, N = self.axis_range(axis)
+            indices.append(int(np.round((theta - m) / self.spacing(axis))))
+        return self.wrap(*indices)
+
+    def angles_of(self, i, j):
+        return self.theta_1_min + i * self.spacing(0), self.theta_2_min + j * self.spacing(1)
+
+    def axis_indices(self, key, axis):
+        """
+        Indices selected by a slice along an axis. Along a periodic axis, the slice can go past the
+        seam (for instance -3:4, or N-2:N+2) and wraps around
+        """
+        N = self.shape[axis]
+        if not isinstance(key, slice):
+            return key % N if self.periodic(axis) else key
+        if not self.periodic(axis):
+            return np.arange(N)[key]
+        start = 0 if key.start is None else key.start
+        stop = N if key.stop is None else key.stop
+        return np.arange(start, stop, key.step or 1) % N
+
+    def window(self, rows, cols):
+        """
+        Occupancy of a region of the grid, wrapping around the periodic axes: data.window(slice(-2, 3), slice(N - 1, N + 1))
+        """
+        return self.data[self.axis_indices(rows, 0)][..., self.axis_indices(cols, 1)]
+
+    def clearance_map(self):
+        """
+        Joint space distance (in radians) from each configuration to the closest colliding one, as np.array (N1, N2) of float32.
+        Exact euclidean distance transform, wrapping around the periodic axes
+        """
+        return euclidean_distance_transform(self.data.to_array(), (self.spacing(0), self.spacing(1)), (self.axis_period(0), self.axis_period(1)))
+
+    def save(self, filepath):
+        header = struct.pack(self.HEADER_FORMAT, self.MAGIC,
+                             self.theta_1_min, self.theta_1_max, self.theta_1_num_samples,
+                             self.theta_2_min, self.theta_2_max, self.theta_2_num_samples)
+        with open(filepath, 'wb') as file:
+            file.write(header.ljust(self.HEADER_SIZE, b"\0"))
+            file.write(np.ascontiguousarray(self.data.packed).tobytes())
+
+    @staticmethod
+    def load(filepath, mmap=False):
+        """
+        Loads a C-space saved with save(). With mmap=True the grid is memory-mapped (read only)
+        instead of being read, so very large maps can be opened without loading them fully
+        """
+        with open(filepath, 'rb') as file:
+            header = file.read(CSPaceData.HEADER_SIZE)
+        if len(header) != CSPaceData.HEADER_SIZE or not header.startswith(CSPaceData.MAGIC):
+            raise ValueError(f"{filepath} is not a C-space file")
+        _, m1, M1, N1, m2, M2, N2 = struct.unpack_from(CSPaceData.HEADER_FORMAT, header)
+
+        shape = (N1, PackedBoolGrid.row_bytes(N2))
+        if mmap:
+            packed = np.memmap(filepath, dtype=np.uint8, mode='r', offset=CSPaceData.HEADER_SIZE, shape=shape)
+        else:
+            packed = np.fromfile(filepath, dtype=np.uint8, offset=CSPaceData.HEADER_SIZE).reshape(shape)
+
+        return CSPaceData(
+            m1, M1, N1,
+            m2, M2, N2,
+            PackedBoolGrid((N1, N2), packed))
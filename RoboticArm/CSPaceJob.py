@@ -0,0 +1,84 @@
+import numpy as np
+import threading
+
+from RoboticArm.RoboticArm import RoboticArm
+from RoboticArm.ObstaclesManager import ObstaclesManager
+from RoboticArm.CSPaceLayers import CSPaceLayers
+
+
+class CSPaceJob:
+    """
+    Brings a CSPaceLayers up to date with the obstacles in a background thread, so that the scene keeps running.
+    Only the layers of the new obstacles are computed (or read from the cache of the layers).
+    The scene polls `progress`, `done` and `result` every frame, and can `cancel` the job.
+    """
+    NUM_TILES = 50 # granularity of the progress bar (and of the cancellation), per obstacle
+
+    def __init__(self, layers: CSPaceLayers, obstacles: ObstaclesManager, arm: RoboticArm):
+        self.layers = layers
+        layers.set_arm(arm) # snapshot, the arm can be moved meanwhile (the thread only uses layers.arm)
+        self.obstacles = list(obstacles.obstacles) # snapshot, the obstacles can be edited meanwhile
+        self.to_add = layers.missing(self.obstacles)
+        self.meshes = {obstacle: (obstacle.get_triangles_array(), obstacle.get_bvh()) for obstacle in self.to_add}
+
+        self.rows_done = 0
+        self.rows_total = len(self.to_add) * len(layers.theta1s)
+        self.result = None
+        self.error = None
+
+        self.cancel_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        try:
+            for obstacle in self.layers.outdated(self.obstacles):
+                self.layers.remove_layer(obstacle)
+
+            for obstacle in self.to_add:
+                if not self.compute_layer(obstacle):
+                    return # cancelled, the layers already computed are kept
+            self.result = self.layers.get_data()
+        except Exception as e:
+            self.error = e
+
+    def compute_layer(self, obstacle):
+        N = self.layers.num_samples
+        triangles, bvh = self.meshes[obstacle]
+        layer = self.layers.cached_layer(triangles)
+        if layer is not None:
+            self.layers.set_layer(obstacle, layer)
+            self.rows_done += N
+            return True
+
+        layer = np.zeros(shape=(N,N), dtype=bool)
+        tiles = self.layers.iter_layer_tiles(triangles, bvh, self.NUM_TILES)
+        try:
+            for start, tile in tiles:
+                layer[start:start + len(tile)] = tile
+                self.rows_done += len(tile)
+                if self.cancel_event.is_set():
+                    return False
+        finally:
+            tiles.close()
+        self.layers.set_layer(obstacle, layer)
+        self.layers.store_layer(triangles, layer)
+        return True
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def progress(self):
+        return self.rows_done / self.rows_total if self.rows_total > 0 else 1.
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def done(self):
+        return not self.thread.is_alive()
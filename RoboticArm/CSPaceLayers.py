@@ -0,0 +1,128 @@
+from RoboticArm.RoboticArm import RoboticArm
+from RoboticArm.CSPaceData import CSPaceData, sample_angles
+from RoboticArm.CSPaceCache import CSPaceCache
+from RoboticArm.Obstacle import Obstacle
+from RoboticArm.ObstaclesManager import ObstaclesManager
+from RoboticArm.utils.cspace_engine import compute_cspace_grid_parallel, compute_self_collision_grid, iter_cspace_tiles
+from RoboticArm.utils.packed_grid import PackedBoolGrid
+
+
+class CSPaceLayers:
+    """
+    C-space stored as one packed occupancy layer per obstacle, the final map being their union (their bitwise or).
+    Adding (or removing) an obstacle only computes (or drops) its own layer.
+    With a CSPaceCache, the layers are also looked up in / stored to the cache.
+    With self_collision=True, an extra layer blocks the poses where the arm intersects itself.
+
+    The layers are computed for a snapshot of the arm (see set_arm), so that they can be computed in the background
+    while the arm moves. They stay valid as long as the geometry of the arm and the angles of its joints after
+    the second one (which fix the slice of the C-space) do not change.
+    """
+    def __init__(self, arm: RoboticArm, theta1_range, theta2_range, num_samples, workers=1, cache: CSPaceCache = None, self_collision=False):
+        m1, M1 = theta1_range
+        m2, M2 = theta2_range
+        N = num_samples
+
+        self.theta1_range = (m1, M1)
+        self.theta2_range = (m2, M2)
+        self.num_samples = N
+        self.theta1s = sample_angles(m1, M1, N)
+        self.theta2s = sample_angles(m2, M2, N)
+        self.workers = workers
+        self.cache = cache
+        self.self_collision = self_collision
+
+        self.arm = None
+        self.arm_key = None
+        self.set_arm(arm)
+
+    @staticmethod
+    def validity_key(arm: RoboticArm):
+        """
+        What the layers depend on in the arm: its geometry and the angles of the joints after the second one
+        """
+        return tuple(arm.get_parameters()) + tuple(arm.get_angles()[2:])
+
+    def set_arm(self, arm: RoboticArm):
+        """
+        The layers are computed for a snapshot of the arm in its current pose from now on. When it changed since
+        the previous snapshot (see validity_key), all the layers are dropped
+        """
+        key = self.validity_key(arm)
+        self.arm = arm.snapshot()
+        if key == self.arm_key:
+            return
+        self.arm_key = key
+
+        self.layers = {} # Obstacle -> PackedBoolGrid (N, N)
+
+        # it does not depend on the obstacles, and is cheap: each column is checked once
+        self.self_collision_layer = None
+        if self.self_collision:
+            self.self_collision_layer = PackedBoolGrid.from_array(compute_self_collision_grid(self.arm, self.theta1s, self.theta2s))
+
+    def __contains__(self, obstacle: Obstacle):
+        return obstacle in self.layers
+
+    # The layer of an obstacle is computed from its triangles np.array (T, 3, 2) and their BVH (Obstacle.get_bvh),
+    # which a background job takes from the obstacle beforehand
+
+    def layer_key(self, triangles):
+        return CSPaceCache.make_key(self.arm, triangles, self.theta1_range, self.theta2_range, self.num_samples)
+
+    def cached_layer(self, triangles):
+        """
+        Returns the layer of the obstacle triangles from the cache, or None
+        """
+        if self.cache is None:
+            return None
+        data = self.cache.get(self.layer_key(triangles))
+        return None if data is None else data.data.to_array()
+
+    def store_layer(self, triangles, layer):
+        if self.cache is not None:
+            self.cache.put(self.layer_key(triangles), CSPaceData.from_array(self.theta1_range, self.theta2_range, layer))
+
+    def compute_layer(self, obstacle: Obstacle):
+        triangles = obstacle.get_triangles_array()
+        layer = self.cached_layer(triangles)
+        if layer is None:
+            layer = compute_cspace_grid_parallel(self.arm, triangles, self.theta1s, self.theta2s, self.workers, obstacle.get_bvh())
+            self.store_layer(triangles, layer)
+        return layer
+
+    def iter_layer_tiles(self, triangles, bvh, num_tiles=None):
+        return iter_cspace_tiles(self.arm, triangles, self.theta1s, self.theta2s, self.workers, num_tiles, bvh)
+
+    def set_layer(self, obstacle: Obstacle, layer):
+        self.layers[obstacle] = PackedBoolGrid.from_array(layer)
+
+    def add_layer(self, obstacle: Obstacle):
+        if obstacle not in self.layers:
+            self.set_layer(obstacle, self.compute_layer(obstacle))
+
+    def remove_layer(self, obstacle: Obstacle):
+        del self.layers[obstacle]
+
+    def missing(self, obstacles: list):
+        return [o for o in obstacles if o not in self.layers]
+
+    def outdated(self, obstacles: list):
+        return [o for o in self.layers if o not in obstacles]
+
+    def sync(self, obstacles: ObstaclesManager):
+        """
+        Drops the layers of the obstacles that were removed from the manager, and computes the new ones
+        """
+        for obstacle in self.outdated(obstacles.obstacles):
+            self.remove_layer(obstacle)
+        for obstacle in self.missing(obstacles.obstacles):
+            self.add_layer(obstacle)
+
+    def get_data(self):
+        N = self.num_samples
+        union = PackedBoolGrid((N, N))
+        for layer in list(self.layers.values()) + [self.self_collision_layer]:
+            if layer is not None:
+                union.packed |= layer.packed
+        return CSPaceData(*self.theta1_range, N, *self.theta2_range, N, union)
@@ -0,0 +1,152 @@
+import numpy as np
+import heapq
+
+from RoboticArm.CSPaceData import CSPaceData
+
+
+class GridPlanner:
+    """
+    A* over the occupancy grid of a CSPaceData, with 8-connectivity and wrap-around along the periodic joints.
+    The cells are flat indices (i * N2 + j) into numpy arrays, and the allowed moves are precomputed once per grid.
+    A diagonal move is only allowed when both cells it cuts are free.
+
+    The open list is bucketed by f = g + h (in integer costs), and all the cells of the lowest bucket are expanded
+    together with array operations. The octile heuristic is consistent, so f never decreases along a move:
+    a bucket is only reached again by the cells that improve inside it, and its cells are final once it is empty
+    (delta-stepping on the costs reduced by the heuristic, the paths are as short as with a binary heap).
+    """
+    COST_SCALE = 1024 # the step costs are rounded to integers, the smallest straight step costing COST_SCALE
+    BUCKET_WIDTH = 1 # in straight steps
+
+    def __init__(self, cspace: CSPaceData):
+        self.cspace = cspace
+        self.N1, self.N2 = cspace.shape
+        self.periodic = (cspace.periodic(0), cspace.periodic(1))
+        self.occupied = cspace.data.to_array()
+
+        s1, s2 = cspace.spacing(0), cspace.spacing(1)
+        unit = min(s1, s2) / self.COST_SCALE
+        self.integer_costs = (round(s1 / unit), round(s2 / unit), round(float(np.hypot(s1, s2)) / unit))
+        s1, s2, diagonal_cost = self.integer_costs
+
+        # neighbours[m, cell] is the cell reached from cell by the move m, -1 when the move is not allowed
+        free = ~self.occupied
+        moves = CSPaceData.NEIGHBOUR_OFFSETS_8
+        self.neighbours = np.empty((len(moves), self.N1 * self.N2), dtype=np.int64)
+        self.steps = np.empty((len(moves), 1), dtype=np.int64)
+        for m, (di, dj) in enumerate(moves):
+            rows, rows_inside = self._axis_move(self.N1, di, self.periodic[0])
+            cols, cols_inside = self._axis_move(self.N2, dj, self.periodic[1])
+            allowed = free & free[rows][:, cols] & rows_inside[:, None] & cols_inside[None, :]
+            if di and dj:
+                allowed &= free[rows, :] & free[:, cols] # would cut the corner of an obstacle
+            self.neighbours[m] = np.where(allowed, rows[:, None] * self.N2 + cols[None, :], -1).ravel()
+            self.steps[m] = diagonal_cost if di and dj else (s1 if di else s2)
+
+    @staticmethod
+    def _axis_move(N, d, periodic):
+        """
+        Index reached from each index of an axis moving by d (clamped when outside the grid), and whether it is inside
+        """
+        moved = np.arange(N) + d
+        if periodic:
+            return moved % N, np.ones(N, dtype=bool)
+        return np.clip(moved, 0, N - 1), (moved >= 0) & (moved < N)
+
+    @staticmethod
+    def _axis_distance_table(N, target, periodic):
+        d = np.abs(np.arange(N) - target)
+        return np.minimum(d, N - d) if periodic else d
+
+    def heuristic_table(self, goal):
+        """
+        Octile distance from every cell to the goal (shortest 8-connected path without obstacles), admissible and
+        consistent, as a flat array of integer costs. With a, b the number of rows and columns to the goal:
+            min(a, b) * diagonal_cost + (a - min(a, b)) * s1 + (b - min(a, b)) * s2
+        """
+        s1, s2, diagonal_cost = self.integer_costs
+        a = self._axis_distance_table(self.N1, goal[0], self.periodic[0])[:, None]
+        b = self._axis_distance_table(self.N2, goal[1], self.periodic[1])[None, :]
+        m = np.minimum(a, b)
+        return (m * diagonal_cost + (a - m) * s1 + (b - m) * s2).ravel()
+
+    def plan_cells(self, start, goal):
+        """
+        Shortest path between two cells (i, j), as a list of cells, None when there is none
+        """
+        N2 = self.N2
+        if self.occupied[start] or self.occupied[goal]:
+            return None
+        start_index = start[0] * N2 + start[1]
+        goal_index = goal[0] * N2 + goal[1]
+
+        h = self.heuristic_table(goal)
+        cost = np.full(self.N1 * N2, np.iinfo(np.int64).max, dtype=np.int64)
+        parent = np.full(self.N1 * N2, -1, dtype=np.int64)
+        cost[start_index] = 0
+        width = self.BUCKET_WIDTH * min(self.integer_costs[:2])
+
+        # buckets[k] lists the arrays of cells pushed with k * width <= f < (k + 1) * width, bucket_heap holds the k
+        first = int(h[start_index]) // width
+        buckets = {first: [np.array([start_index])]}
+        bucket_heap = [first]
+        while bucket_heap:
+            k = heapq.heappop(bucket_heap)
+            if cost[goal_index] < k * width:
+                break # the bucket of the goal is done
+            cells = np.unique(np.concatenate(buckets.pop(k)))
+            cells = cells[(cost[cells] + h[cells]) // width == k] # the others improved into an earlier bucket
+
+            while cells.size > 0:
+                targets = self.neighbours[:, cells]
+                new_cost = cost[cells] + self.steps
+                sources = np.broadcast_to(cells, targets.shape)
+                improved = targets >= 0
+                improved[improved] = new_cost[improved] < cost[targets[improved]]
+                targets, new_cost, sources = targets[improved], new_cost[improved], sources[improved]
+
+                np.minimum.at(cost, targets, new_cost)
+                best = cost[targets] == new_cost
+                parent[targets[best]] = sources[best]
+                targets = np.unique(targets[best])
+
+                target_buckets = (cost[targets] + h[targets]) // width
+                later = target_buckets != k
+                for b in np.unique(target_buckets[later]).tolist():
+                    if b not in buckets:
+                        buckets[b] = []
+                        heapq.heappush(bucket_heap, b)
+                    buckets[b].append(targets[target_buckets == b])
+                cells = targets[~later]
+
+        if parent[goal_index] < 0 and goal_index != start_index:
+            return None
+
+        path = []
+        index = goal_index
+        while index != -1:
+            path.append(divmod(index, N2))
+            index = int(parent[index])
+        return path[::-1]
+
+    def plan(self, start_angles, goal_angles):
+        """
+        Shortest joint space path between two configurations (theta1, theta2), as an np.array (K, 2) of angles.
+        The angles are unwrapped along the path (it can go past ±pi), so that it can be followed continuously
+        with RoboticArm.update_angles. Returns None when the goal cannot be reached
+        """
+        start = self.cspace.index_of(*start_angles)
+        goal = self.cspace.index_of(*goal_angles)
+        if start is None or goal is None:
+            return None
+        cells = self.plan_cells(start, goal)
+        if cells is None:
+            return None
+
+        path = np.array([self.cspace.angles_of(i, j) for i, j in cells], dtype=float)
+        path[0] = start_angles
+        path[-1] = goal_angles
+        for axis in (0, 1):
+            if self.cspace.periodic(axis):
+                path[:, axis] = np.unwrap(path[:, axis])
+        return path
@@ -3,12 +3,26 @@ from lib.Math.Vector import Vector2 as V
 
 from RoboticArm.colors import *
 from RoboticArm.utils.mesh_generation import *
+from RoboticArm.utils.delaunay import DelaunayTriangulation
+from RoboticArm.utils.cspace_engine import triangles_bvh
 
 class Obstacle:
+    """
+    Polygonal obstacle, triangulated from its points. The mesh is stored by indices: vertices is a np.array (N, 2)
+    of the points, triangle_indices a np.array (T, 3) of int32 (counterclockwise triangles), and edges maps each
+    directed edge (i, j) of a triangle to the row of that triangle.
+    boundary holds every loop of the outline (point indices, outer ring first), polygon is the outer ring
+    """
     def __init__(self, points, draw_mesh=False, make=True):
         self.points = points
-        self.triangles = []
+        self.vertices = np.zeros((0, 2))
+        self.triangle_indices = np.zeros((0, 3), dtype=np.int32)
+        self.edges = {}
+        self.boundary = []
         self.polygon = []
+        self.bvh = None # built on demand from the triangles, reset by set_mesh
+        self.triangulation = None # DelaunayTriangulation of the points, None until the obstacle is made
+        self.vertex_ids = [] # index of each point in the triangulation
 
         self.draw_mesh = draw_mesh
         if make:
@@ -36,72 +50,87 @@ class Obstacle:
 
     def add_point(self, point):
         self.points.append(point)
-        self.make_obstacle()
+        if self.triangulation is None:
+            self.make_obstacle()
+        else:
+            # only the triangles around the new point change
+            self.vertex_ids.append(self.triangulation.insert(point))
+            self.update_from_triangulation()
 
 
     def make_obstacle(self):
-        if len(self.points) < 3:
-            self.supertriangle = []
-            self.triangles = []
-            return 
-        # Makes the triangles using BowyerWatson algorithm
-
-        # 1) find the super triangle using Weltz algo
-        supertriangle = tuple([V(-99999999999.0,-99999999999.0), V(0.0,99999999999.0), V(99999999999.0,0.0)])
-        triangulation = {supertriangle}
-
-        # 2) Run the algo (https://en.wikipedia.org/wiki/Bowyer%E2%80%93Watson_algorithm)
-        for point in self.points:
-            # a) find bag triangles
-            bad_triangles = set()
-            for triangle in triangulation:
-                if point_inside_circumcircle(point, triangle):
-                    bad_triangles.add(triangle)
-
-            # b) find the boundary of the polygonal hole
-            polygon = set()
-            for triangle in bad_triangles:
-                for edge in triangle_edges(triangle):
-                    if not edge_in_triangles(edge, bad_triangles - {triangle}):
-                        polygon.add(edge)
-                
-            # c) remove bad triangles
-            for triangle in bad_triangles:
-                triangulation.remove(triangle)
-
-            # d) re-triangulate the hole
-            for edge in polygon:
-                new_tri = (edge[0], point, edge[1])
-                triangulation.add(new_tri)
-                
-        # 3) Exclude the triangle that are based on the supertriangle
-        self.triangles = []
-        for triangle in triangulation:
-            for triangle_vertex in triangle:
-                if triangle_vertex in supertriangle:
-                    break
-            else:
-                self.triangles.append(triangle)
-        
-        # 4) Make polygon formed by triangles
-        self.polygon = make_polygon_from_triangles(self.triangles)
+        # Makes the triangles using BowyerWatson algorithm (https://en.wikipedia.org/wiki/Bowyer%E2%80%93Watson_algorithm),
+        # the triangulation is kept to insert or remove the next points incrementally
+        self.triangulation = DelaunayTriangulation()
+        self.vertex_ids = self.triangulation.insert_many(self.points)
+        self.update_from_triangulation()
+
 
-        # print(f'Now has {len(self.triangles)} triangles')
+    def update_from_triangulation(self):
+        """
+        Updates the mesh after an edit of the triangulation
+        """
+        if len(self.points) < 3:
+            self.set_mesh([])
+            return
+        position = {vertex: k for k, vertex in enumerate(self.vertex_ids)}
+        self.set_mesh([[position[v] for v in triangle] for triangle in self.triangulation.get_triangles()])
+
+
+    def set_mesh(self, triangle_indices):
+        """
+        Sets the triangles (indices in the points), then updates the edge table and the boundary (the BVH is rebuilt on demand)
+        """
+        self.vertices = np.array([[p.x, p.y] for p in self.points], dtype=np.float64).reshape(-1, 2)
+        self.triangle_indices = np.array(triangle_indices, dtype=np.int32).reshape(-1, 3)
+        self.edges = {}
+        for row, (i, j, k) in enumerate(self.triangle_indices.tolist()):
+            self.edges[(i, j)] = self.edges[(j, k)] = self.edges[(k, i)] = row
+        self.boundary = boundary_loops(self.vertices, self.triangle_indices, self.edges)
+        self.polygon = [self.points[i] for i in self.boundary[0]] if len(self.boundary) > 0 else []
+        self.bvh = None
+
+
+    def get_triangles(self):
+        """
+        The triangles as tuples of points (Vector2)
+        """
+        points = self.points
+        return [(points[i], points[j], points[k]) for i, j, k in self.triangle_indices.tolist()]
+
+    def get_triangles_array(self):
+        """
+        The triangles as a np.array (T, 3, 2), as used by the vectorized collision checks
+        """
+        return self.vertices[self.triangle_indices]
+
+    def get_bvh(self):
+        """
+        BVH of the boxes of the triangles of get_triangles_array() (see cspace_engine.triangles_bvh)
+        """
+        if self.bvh is None:
+            self.bvh = triangles_bvh(self.get_triangles_array())
+        return self.bvh
 
-            
     def remove_point_if_close(self, point, delete_radius, remake_obstacle=True):
-        delete_any = False
-        for p in self.points:
-            if abs(point - p) <= delete_radius:
-                self.points.remove(p)
-                delete_any = True
-        
-        if delete_any and remake_obstacle:
-            self.make_obstacle()
-        return delete_any
+        removed = [k for k, p in enumerate(self.points) if abs(point - p) <= delete_radius]
+        for k in reversed(removed):
+            self.points.pop(k)
+            if self.triangulation is not None:
+                vertex = self.vertex_ids.pop(k)
+                if vertex not in self.vertex_ids: # the vertex can be shared with a point at the same place
+                    self.triangulation.remove(vertex)
+
+        if len(removed) > 0:
+            if not remake_obstacle:
+                self.triangulation = None # the caller rebuilds the obstacle later
+            elif self.triangulation is None:
+                self.make_obstacle()
+            else:
+                self.update_from_triangulation()
+        return len(removed) > 0
     
 
-    
     @staticmethod
     def load_vector_list(data):
         out = []
@@ -126,7 +155,7 @@ class Obstacle:
             data[var] = self.__getattribute__(var)
         data["points"] = self.dump_vector_list(self.points)
         data["triangles"] = []
-        for triangle in self.triangles:
+        for triangle in self.get_triangles():
             data["triangles"].append(self.dump_vector_list(triangle))
         data["polygon"] = self.dump_vector_list(self.polygon)
         return data
@@ -137,33 +166,45 @@ class Obstacle:
         to_load = "draw_options".split(' ')
 
         points = Obstacle.load_vector_list(data["points"])
-        polygon = Obstacle.load_vector_list(data["polygon"])
-        triangles = []
-        for t in data["triangles"]:
-            triangles.append(Obstacle.load_vector_list(t))
+        index = {(item["x"], item["y"]): k for k, item in enumerate(data["points"])}
 
         o = Obstacle(points, data["draw_mesh"], False)
         for var in to_load:
             o.__setattr__(var, data[var])
-        o.polygon = polygon
-        o.triangles = triangles
+        try:
+            triangles = [[index[(item["x"], item["y"])] for item in t] for t in data["triangles"]]
+        except KeyError:
+            o.make_obstacle() # the saved triangles do not match the points
+            return o
+
+        # counterclockwise triangles
+        triangles = np.array(triangles, dtype=np.int32).reshape(-1, 3)
+        corners = np.array([[p.x, p.y] for p in points], dtype=np.float64).reshape(-1, 2)[triangles]
+        AB, AC = corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]
+        clockwise = AB[:, 0] * AC[:, 1] - AB[:, 1] * AC[:, 0] < 0
+        triangles[clockwise] = triangles[clockwise][:, [0, 2, 1]]
+        o.set_mesh(triangles)
         return o
 
 
     def draw(self, scene):
-        for triangle in self.triangles:
+        triangles = self.get_triangles()
+        for triangle in triangles:
             scene.draw_filled_triangle(triangle, self.draw_options["polygon"]["color"])
 
         if self.draw_mesh:
-            if len(self.triangles) > 0:
-                for triangle in self.triangles:
+            if len(triangles) > 0:
+                for triangle in triangles:
                     scene.draw_polygon(triangle, self.draw_options["triangles"]["color"], self.draw_options["triangles"]["radius"])
-                for point in self.polygon:
-                    scene.draw_point(point, self.draw_options["points"]["color"], self.draw_options["points"]["radius"])
+                for loop in self.boundary:
+                    for i in loop:
+                        scene.draw_point(self.points[i], self.draw_options["points"]["color"], self.draw_options["points"]["radius"])
             else:
                 for point in self.points:
                     scene.draw_point(point, self.draw_options["points"]["color"], self.draw_options["points"]["radius"])
         else:
-            scene.draw_polygon(self.polygon, self.draw_options["outline"]["color"], self.draw_options["outline"]["width"])
-            for point in self.polygon:
-                scene.draw_point(point, self.draw_options["points"]["color"], self.draw_options["points"]["radius"])
+            for loop in self.boundary:
+                outline = [self.points[i] for i in loop]
+                scene.draw_polygon(outline, self.draw_options["outline"]["color"], self.draw_options["outline"]["width"])
+                for point in outline:
+                    scene.draw_point(point, self.draw_options["points"]["color"], self.draw_options["points"]["radius"])
@@ -4,8 +4,19 @@ from lib.Math.Vector import Vector2 as V
 from RoboticArm.colors import *
 from RoboticArm.utils.mesh_generation import *
 from RoboticArm.Obstacle import Obstacle
+from RoboticArm.utils.cspace_engine import triangles_bvh
 
 import json
+from dataclasses import dataclass
+
+
+@dataclass
+class ClearanceData:
+    distance: float # signed, negative when penetrating (minus the penetration depth)
+    point: V # witness point on the queried triangles
+    obstacle_point: V # witness point on the closest obstacle triangle
+    obstacle_triangle: list
+
 
 class ObstaclesManager:
     def __init__(self, draw_mesh=False, current_draw_mesh=True):
@@ -16,14 +27,81 @@ class ObstaclesManager:
 
         self.current_new_obstacle = Obstacle([], self.current_draw_mesh, False)
 
+        # built lazily from the confirmed obstacles, reset by changed()
+        self.all_triangles = None
+        self.triangles_array = None
+        self.bvh = None
+
+    def changed(self):
+        """
+        Must be called when the list of obstacles changes, the spatial structures are then rebuilt on the next query
+        """
+        self.all_triangles = None
+        self.triangles_array = None
+        self.bvh = None
+
     def get_all_triangles(self):
-        out = []
-        for o in self.obstacles:
-            out += o.triangles
-        return out
+        if self.all_triangles is None:
+            self.all_triangles = []
+            for o in self.obstacles:
+                self.all_triangles += o.get_triangles()
+        return self.all_triangles
+
+    def get_triangles_array(self):
+        if self.triangles_array is None:
+            self.triangles_array = np.concatenate([o.get_triangles_array() for o in self.obstacles] + [np.zeros((0, 3, 2))])
+        return self.triangles_array
+
+    def get_bvh(self):
+        """
+        BVH of the boxes of the triangles of get_triangles_array(), given along with it to the vectorized collision checks
+        """
+        if self.bvh is None:
+            self.bvh = triangles_bvh(self.get_triangles_array())
+        return self.bvh
+
+    def query_box(self, box):
+        """
+        Returns the indices (in get_all_triangles()) of the obstacle triangles whose bounding box overlaps the box
+        """
+        return self.get_bvh().query_box(box)
+
+    def query_segment(self, P1, P2):
+        """
+        Returns the indices (in get_all_triangles()) of the obstacle triangles whose bounding box is crossed by the segment
+        """
+        return self.get_bvh().query_segment(P1, P2)
+
+    def distance_to_triangles(self, triangles):
+        """
+        Signed distance between the given triangles (the arm for instance) and the closest obstacle triangle.
+        The BVH is searched best-first, the nodes farther than the best distance found so far are pruned.
+        Returns a ClearanceData, or None when there is no obstacle
+        """
+        if len(triangles) == 0:
+            return None
+        boxes = [triangle_bounding_box(triangle) for triangle in triangles]
+        box = merge_bounding_boxes(boxes)
+        obstacle_triangles = self.get_all_triangles()
+        bvh = self.get_bvh()
+
+        def exact(i):
+            A, A_box = obstacle_triangles[i], bvh.box_list[i]
+            best = None
+            for B, B_box in zip(triangles, boxes):
+                if best is not None and best.distance >= 0 and box_distance(A_box, B_box) >= best.distance:
+                    continue
+                distance, QA, QB = triangle_distance(A, B)
+                if best is None or distance < best.distance:
+                    best = ClearanceData(distance, QB, QA, A)
+            return best.distance, best
+
+        result = bvh.nearest(box, exact)
+        return None if result is None else result[1]
 
     def add_obstacle(self, o: Obstacle):
         self.obstacles.append(o)
+        self.changed()
 
     def add_point_to_current_obstacle(self, point):
         self.current_new_obstacle.add_point(point)
@@ -38,6 +116,7 @@ class ObstaclesManager:
     def confirm_current(self):
         self.current_new_obstacle.draw_mesh = self.draw_mesh
         self.obstacles.append(self.current_new_obstacle)
+        self.changed()
         self.reset_current()
 
     def reset_current(self):
@@ -67,4 +146,5 @@ class ObstaclesManager:
 
     def clear(self):
         self.obstacles = []
+        self.changed()
         self.reset_current()
@@ -1,74 +1,321 @@
 import numpy as np
+from dataclasses import dataclass
 from lib.Math.Vector import Vector2 as V
 
 from RoboticArm.colors import *
 from RoboticArm.utils.mesh_generation import *
 from RoboticArm.ArmPiece import ArmPiece
-from RoboticArm.ObstaclesManager import ObstaclesManager
-
-import numpy as np
+from RoboticArm.ObstaclesManager import ObstaclesManager, ClearanceData
+from RoboticArm.utils.cspace_engine import compute_cspace_grid_parallel, compute_cspace_grid_adaptive, compute_self_collision_grid, \
+    clearance_batch, self_collision_mask_poses, ARM_TRIANGLES
+from RoboticArm.CSPaceData import CSPaceData, sample_angles, is_full_turn
+from RoboticArm.CSPaceCache import CSPaceCache
 
-from dataclasses import dataclass
-import matplotlib.pyplot as plt
 
 @dataclass
-class CSPaceData:
-    theta_1_min: float
-    theta_1_max: float
-    theta_1_num_samples: int
-    theta_2_min: float
-    theta_2_max: float
-    theta_2_num_samples: int
+class ArmPoses:
+    """
+    Result of RoboticArm.forward_kinematics, for poses of shape (...) (M poses for instance) of an arm of N pieces
+    """
+    corners: np.ndarray # (..., N, 4, 2) corners of each piece, in the order of ArmPiece.get_arm_points
+    pivots: np.ndarray # (..., N, 2) pivot position of each piece
+    attaches: np.ndarray # (..., N, 2) attach position of each piece
 
-    data: np.array
+    def triangles(self):
+        """
+        The 2N triangles of the arm (same order as RoboticArm.get_all_triangles), as np.array (..., 2N, 3, 2)
+        """
+        triangles = self.corners[..., ARM_TRIANGLES, :]
+        return triangles.reshape(triangles.shape[:-4] + (-1, 3, 2))
 
 
 class RoboticArm:
-    def __init__(self, position: V, theta1: float, theta2: float, piece_size1: V, piece_size2: V, pivot1: V, pivot2: V, attach1: V, attach2: V):
-        self.arm_piece1 = ArmPiece(position, theta1, piece_size1, pivot1, attach1)
-        self.arm_piece2 = ArmPiece(self.arm_piece1.attach_position, theta1 + theta2, piece_size2, pivot2, attach2)
+    """
+    Planar serial arm: piece k is attached to the attach point of piece k - 1, the first one to `position`.
+    thetas[0] is the angle of the first piece, thetas[k] the angle of piece k relative to piece k - 1
+    """
+    def __init__(self, position: V, thetas, piece_sizes, pivots, attaches):
+        if not len(thetas) == len(piece_sizes) == len(pivots) == len(attaches):
+            raise ValueError("The arm needs one angle, size, pivot and attach point per piece")
+        self.position = position
+        self.thetas = list(thetas)
+        self.pieces = []
+        pivot_position, theta = position, 0.
+        for k, (size, pivot, attach) in enumerate(zip(piece_sizes, pivots, attaches)):
+            theta = self.thetas[0] if k == 0 else theta + self.thetas[k]
+            piece = ArmPiece(pivot_position, theta, size, pivot, attach)
+            self.pieces.append(piece)
+            pivot_position = piece.attach_position
+
+        # pairs of pieces tested for self-collision: two adjacent pieces share a joint, they always touch
+        N = len(self.pieces)
+        self.self_collision_skip = np.abs(np.subtract.outer(np.arange(N), np.arange(N))) <= 1
+        self.self_collision_pairs = [(int(i), int(j)) for i, j in zip(*np.nonzero(np.triu(~self.self_collision_skip)))]
+
+    @property
+    def num_joints(self):
+        return len(self.pieces)
+
+    def get_angles(self):
+        return list(self.thetas)
+
+    def snapshot(self):
+        """
+        Copy of the arm (geometry and joint angles), which does not move when the arm is moved
+        """
+        return RoboticArm(V(self.position), self.get_angles(), [V(piece.size) for piece in self.pieces],
+                          [V(piece.pivot_offset) for piece in self.pieces], [V(piece.attach_offset) for piece in self.pieces])
+
+    def joint_vectors(self, theta1, theta2):
+        """
+        Joint vectors np.array (..., N) of the (theta1, theta2) slice of the joint space: the other joints keep their current angle
+        """
+        theta1, theta2 = np.broadcast_arrays(np.asarray(theta1, dtype=float), np.asarray(theta2, dtype=float))
+        out = np.empty(theta1.shape + (self.num_joints,))
+        out[...] = self.thetas
+        out[..., 0] = theta1
+        out[..., 1] = theta2
+        return out
 
     def does_intersect(self, obstacles: ObstaclesManager):
-        for A in obstacles.get_all_triangles():
-            for B in self.get_all_triangles():
-                if triangle_intersection(A, B):
+        arm_triangles = self.get_all_triangles()
+        arm_boxes = [triangle_bounding_box(B) for B in arm_triangles]
+        arm_box = merge_bounding_boxes(arm_boxes)
+
+        # broad phase: the BVH of the obstacles gives the triangles whose box overlaps the arm,
+        # they are only tested against the arm triangles whose box overlaps theirs
+        obstacle_triangles = obstacles.get_all_triangles()
+        bvh = obstacles.get_bvh()
+        for i in obstacles.query_box(arm_box):
+            A, A_box = obstacle_triangles[i], bvh.box_list[i]
+            for B, B_box in zip(arm_triangles, arm_boxes):
+                if boxes_overlap(A_box, B_box) and triangle_intersection(A, B):
                     return True
         return False
-                
+
+    def does_self_intersect(self):
+        """
+        True when two non adjacent pieces intersect (in the current pose)
+        """
+        triangles = [piece.get_arm_triangles() for piece in self.pieces]
+        boxes = [[triangle_bounding_box(T) for T in piece_triangles] for piece_triangles in triangles]
+        piece_boxes = [merge_bounding_boxes(piece_boxes) for piece_boxes in boxes]
+        for i, j in self.self_collision_pairs:
+            if not boxes_overlap(piece_boxes[i], piece_boxes[j]):
+                continue
+            for A, A_box in zip(triangles[i], boxes[i]):
+                for B, B_box in zip(triangles[j], boxes[j]):
+                    if boxes_overlap(A_box, B_box) and triangle_intersection(A, B):
+                        return True
+        return False
+
+    def self_collision_batch(self, thetas):
+        """
+        Vectorized does_self_intersect, for np.array (M, N) of joint vectors
+        """
+        return self_collision_mask_poses(self, thetas)
+
+    def clearance(self, obstacles: ObstaclesManager) -> ClearanceData:
+        """
+        Signed distance between the arm (in its current pose) and the closest obstacle, with the witness points.
+        Negative when colliding (minus the penetration depth), None when there is no obstacle
+        """
+        return obstacles.distance_to_triangles(self.get_all_triangles())
+
+    def clearance_batch(self, thetas, obstacles: ObstaclesManager):
+        """
+        Signed distance to the obstacles for many poses, thetas being np.array (M, N) of joint vectors
+        """
+        return clearance_batch(self, obstacles.get_triangles_array(), thetas, obstacles.get_bvh())
+
+    def clearance_at(self, thetas, obstacles: ObstaclesManager) -> ClearanceData:
+        """
+        clearance() in the pose `thetas`, the arm is left in its current pose
+        """
+        old_thetas = self.get_angles()
+        self.update_angles(*thetas)
+        try:
+            return self.clearance(obstacles)
+        finally:
+            self.update_angles(*old_thetas)
+
+    def motion_speed(self, start, end):
+        """
+        Upper bound of the distance travelled by any point of the arm during the straight joint space motion start -> end.
+        Piece k turns by the sum of the joint motions up to k, around a pivot that moves by at most
+        the sum of reach * |turn| of the previous pieces
+        """
+        speed = 0.
+        pivot_motion = 0.
+        turn = 0.
+        for piece, a, b in zip(self.pieces, start, end):
+            turn += b - a
+            speed = max(speed, pivot_motion + piece.get_radius() * abs(turn))
+            pivot_motion += piece.get_reach() * abs(turn)
+        return speed
+
+    def first_contact(self, start, end, obstacles: ObstaclesManager, tolerance=1e-2):
+        """
+        Continuous collision check of the straight joint space motion start -> end (joint vectors), by conservative advancement:
+        with a clearance d at the parameter t, nothing can be hit before t + d / motion_speed, so the motion jumps there.
+        Thin obstacles cannot be tunneled through, whatever the length of the motion.
+
+        Returns:
+            the parameter t in [0, 1] of the first contact (the arm is within `tolerance` of an obstacle in the pose
+            start + t * (end - start), and free before), or None when the whole motion is free
+        """
+        speed = self.motion_speed(start, end)
+        t = 0.
+        while t <= 1.:
+            clearance = self.clearance_at([a + t * (b - a) for a, b in zip(start, end)], obstacles)
+            if clearance is None:
+                return None
+            if clearance.distance <= tolerance:
+                return t
+            if speed == 0:
+                return None
+            t += clearance.distance / speed # at least tolerance / speed, so the loop ends
+        return None
+
+    def first_contact_after_leaving(self, start, end, obstacles: ObstaclesManager, tolerance=1e-2):
+        """
+        first_contact of a motion that starts in contact with an obstacle. Until the clearance gets above `tolerance`,
+        the motion is followed by steps of tolerance / motion_speed (no point of the arm moves by more than tolerance
+        between two checks) and stopped if it goes deeper than the start pose; from there it is checked by first_contact.
+
+        Returns:
+            the parameter t in [0, 1] where the motion must stop, or None when the whole motion is free
+        """
+        speed = self.motion_speed(start, end)
+        if speed == 0:
+            return None
+        limit = min(self.clearance_at(start, obstacles).distance, 0.)
+        t = 0.
+        while True:
+            next_t = min(1., t + tolerance / speed)
+            clearance = self.clearance_at([a + next_t * (b - a) for a, b in zip(start, end)], obstacles)
+            if clearance is None:
+                return None
+            if clearance.distance < limit:
+                return t
+            t = next_t
+            if clearance.distance > tolerance:
+                break
+            if t >= 1.:
+                return None
+
+        contact = self.first_contact([a + t * (b - a) for a, b in zip(start, end)], end, obstacles, tolerance)
+        return None if contact is None else t + contact * (1. - t)
+
+    def get_parameters(self):
+        """
+        Geometry of the arm (base position and pieces), used to identify it in the C-space cache
+        """
+        out = [self.position.x, self.position.y]
+        for piece in self.pieces:
+            out += piece.get_parameters()
+        return out
+
+    def forward_kinematics(self, thetas) -> ArmPoses:
+        """
+        Positions of the pieces for many poses at once. The cos / sin of each joint are computed once per pose,
+        and give the same values as the scalar path.
+
+        Arguments:
+            thetas: np.array (..., K) -> joint vectors, K <= N: only the first K pieces are computed
+        """
+        thetas = np.asarray(thetas, dtype=float)
+        absolute = np.cumsum(thetas, axis=-1)
+
+        corners, pivots, attaches = [], [], []
+        pivot = np.array([self.position.x, self.position.y], dtype=float)
+        for k in range(thetas.shape[-1]):
+            piece_corners, attach = self.pieces[k].get_points_array(pivot, absolute[..., k])
+            corners.append(piece_corners)
+            pivots.append(np.broadcast_to(pivot, attach.shape))
+            attaches.append(attach)
+            pivot = attach
+
+        return ArmPoses(
+            np.stack(np.broadcast_arrays(*corners), axis=-3),
+            np.stack(np.broadcast_arrays(*pivots), axis=-2),
+            np.stack(np.broadcast_arrays(*attaches), axis=-2))
 
     def get_all_triangles(self):
-        return self.arm_piece1.get_arm_triangles() + self.arm_piece2.get_arm_triangles()
-    
+        out = []
+        for piece in self.pieces:
+            out += piece.get_arm_triangles()
+        return out
+
 
-    def update_angles(self, theta1, theta2):
-        self.arm_piece1.update_theta(theta1)
-        self.arm_piece2.update(self.arm_piece1.attach_position, theta1 + theta2)
-    
+    def update_angles(self, *thetas):
+        """
+        Sets the joint angles (one per piece). The pieces before the first joint that changed are not moved
+        """
+        if len(thetas) != self.num_joints:
+            raise ValueError(f"Expected {self.num_joints} angles, got {len(thetas)}")
+        first = next((k for k, (old, new) in enumerate(zip(self.thetas, thetas)) if old != new), self.num_joints)
+        self.thetas = list(thetas)
+        for k in range(first, self.num_joints):
+            if k == 0:
+                self.pieces[0].update(self.position, self.thetas[0])
+            else:
+                previous = self.pieces[k - 1]
+                self.pieces[k].update(previous.attach_position, previous.theta + self.thetas[k])
 
-    def computeCSPace(self, theta1_range: float, theta2_range: float, num_samples: float, obstacles: ObstaclesManager):
+
+    def computeCSPace(self, theta1_range: float, theta2_range: float, num_samples: float, obstacles: ObstaclesManager, vectorized=True, workers=1, cache: CSPaceCache = None, adaptive=False, self_collision=False):
+        """
+        Samples the (theta1, theta2) space on a num_samples x num_samples grid, a cell is 1 when the arm hits an obstacle.
+        With more than two pieces, it is the slice where the other joints keep their current angle.
+        A range covering a full turn is sampled without its end, which is the same angle as its start
+        vectorized=False uses the (slow) scalar path, kept as a reference for the vectorized engine
+        workers > 1 splits the theta1 axis in tiles computed by a pool of processes
+        cache: when given, the result is looked up in / stored to this CSPaceCache
+        adaptive=True refines a coarse grid with a quadtree around the obstacle boundaries instead of checking every cell
+        (much fewer collision checks, but obstacles thinner than the coarse cells may be missed; small grids are
+        computed in full), it is never cached
+        self_collision=True also blocks the cells where two pieces of the arm intersect
+        """
         m1, M1 = theta1_range
         m2, M2 = theta2_range
         N = num_samples
 
-        data = CSPaceData(
-            m1, M1, N,
-            m2, M2, N,
-            np.zeros(shape=(N,N)))
-        
-        old_theta1 = self.arm_piece1.theta
-        old_theta2 = self.arm_piece2.theta
+        if adaptive:
+            grid = compute_cspace_grid_adaptive(self, obstacles.get_triangles_array(), sample_angles(m1, M1, N), sample_angles(m2, M2, N),
+                                                periodic=(is_full_turn(m1, M1), is_full_turn(m2, M2)), bvh=obstacles.get_bvh())
+            if self_collision:
+                grid |= compute_self_collision_grid(self, sample_angles(m1, M1, N), sample_angles(m2, M2, N))
+            return CSPaceData.from_array(theta1_range, theta2_range, grid)
+
+        if vectorized:
+            triangles = obstacles.get_triangles_array()
+            if cache is not None:
+                key = CSPaceCache.make_key(self, triangles, theta1_range, theta2_range, N, self_collision)
+                data = cache.get(key)
+                if data is not None:
+                    return data
+
+            grid = compute_cspace_grid_parallel(self, triangles, sample_angles(m1, M1, N), sample_angles(m2, M2, N), workers, obstacles.get_bvh())
+            if self_collision:
+                grid |= compute_self_collision_grid(self, sample_angles(m1, M1, N), sample_angles(m2, M2, N))
+            data = CSPaceData.from_array(theta1_range, theta2_range, grid)
+            if cache is not None:
+                cache.put(key, data)
+            return data
+
+        grid = np.zeros(shape=(N,N), dtype=bool)
+        old_thetas = self.get_angles()
 
-        for (i, theta1) in enumerate(np.linspace(m1, M1, N)):
-          for (j, theta2) in enumerate(np.linspace(m2, M2, N)):
-                self.update_angles(theta1, theta2)
-                data.data[i, j] = self.does_intersect(obstacles)
-                
-        self.update_angles(old_theta1, old_theta2 - old_theta1)
+        for (i, theta1) in enumerate(sample_angles(m1, M1, N)):
+          for (j, theta2) in enumerate(sample_angles(m2, M2, N)):
+                self.update_angles(theta1, theta2, *old_thetas[2:])
+                grid[i, j] = self.does_intersect(obstacles) or (self_collision and self.does_self_intersect())
 
-        plt.imshow(data.data)
-        plt.show()
+        self.update_angles(*old_thetas)
+        return CSPaceData.from_array(theta1_range, theta2_range, grid)
 
 
     def draw(self, scene):
-        self.arm_piece1.draw(scene)
-        self.arm_piece2.draw(scene)
+        for piece in self.pieces:
+            piece.draw(scene)
@@ -0,0 +1,224 @@
+import numpy as np
+
+from RoboticArm.ObstaclesManager import ObstaclesManager
+from RoboticArm.CSPaceData import is_full_turn
+from RoboticArm.utils.cspace_engine import collision_mask, piece_triangles_batch, self_collision_mask_poses
+from RoboticArm.utils.kdtree import KDTree
+
+
+class SamplingPlanner:
+    """
+    RRT-Connect in the joint space of an arm of N pieces, without computing the C-space: the collision checker
+    is only called on the configurations the trees reach and on the motions between them.
+
+    The motions are checked on a lattice of num_samples angles per joint (sampled like computeCSPace samples its
+    axes, one sample per cell crossed), so with two pieces a path found here is free in the grid that computeCSPace
+    would give. The collision results are cached per piece: piece k only depends on the first k joints, so its
+    result is shared by all the cells with the same first k joints. The nearest neighbours are found with a KDTree
+    that wraps around the periodic joints.
+    With self_collision=True, the configurations where the arm intersects itself are also colliding.
+    """
+    BATCH_SIZE = 64 # poses checked at once along a motion, the check stops at the first colliding batch
+
+    def __init__(self, arm, obstacles: ObstaclesManager, ranges, num_samples,
+                 step_size=0.3, max_iterations=10000, seed=None, self_collision=False):
+        """
+        Arguments:
+            ranges: list of (min, max) -> range of each joint, a range covering a full turn wraps around
+        """
+        if len(ranges) != arm.num_joints:
+            raise ValueError(f"Expected {arm.num_joints} joint ranges, got {len(ranges)}")
+        self.arm = arm
+        self.obstacle_triangles = obstacles.get_triangles_array()
+        self.obstacle_bvh = obstacles.get_bvh()
+        self.dimension = len(ranges)
+        self.num_samples = num_samples
+        self.step_size = step_size
+        self.max_iterations = max_iterations
+        self.rng = np.random.default_rng(seed)
+
+        self.lower = np.array([m for m, M in ranges], dtype=float)
+        self.upper = np.array([M for m, M in ranges], dtype=float)
+        self.periods = [M - m if is_full_turn(m, M) else None for m, M in ranges]
+        self.spacing = np.array([(M - m) / num_samples if period is not None else (M - m) / max(1, num_samples - 1)
+                                 for (m, M), period in zip(ranges, self.periods)])
+
+        self.cache = [{} for _ in range(self.dimension)] # per piece: lattice cells of its joints -> colliding
+        self.self_collision = self_collision and len(arm.self_collision_pairs) > 0
+        self.self_collision_cache = {} # lattice cells of the joints after the first one -> self colliding
+        self.checks = 0 # number of piece poses given to the collision checker
+
+    def wrap(self, configs):
+        """
+        Brings configurations (..., N) back in the ranges along the periodic axes
+        """
+        configs = np.array(configs, dtype=float)
+        for axis, period in enumerate(self.periods):
+            if period is not None:
+                configs[..., axis] = (configs[..., axis] - self.lower[axis]) % period + self.lower[axis]
+        return configs
+
+    def difference(self, a, b):
+        """
+        Shortest motion from a to b, going across the seam of the periodic axes when it is shorter
+        """
+        d = np.asarray(b, dtype=float) - np.asarray(a, dtype=float)
+        for axis, period in enumerate(self.periods):
+            if period is not None:
+                d[..., axis] = (d[..., axis] + period / 2) % period - period / 2
+        return d
+
+    def cells_of(self, configs):
+        """
+        Closest lattice cells of configurations (M, N), as np.array (M, N) of int, and the mask of the configurations
+        outside of the non periodic ranges
+        """
+        cells = np.round((configs - self.lower) / self.spacing).astype(np.int64)
+        outside = np.zeros(len(configs), dtype=bool)
+        for axis, period in enumerate(self.periods):
+            if period is not None:
+                cells[:, axis] %= self.num_samples
+            else:
+                outside |= (cells[:, axis] < 0) | (cells[:, axis] >= self.num_samples)
+        return cells, outside
+
+    def colliding(self, configs):
+        """
+        Collision status of configurations (M, N), the status of the closest lattice cell. Outside of the
+        non periodic ranges, the configurations are colliding
+        """
+        configs = np.asarray(configs, dtype=float).reshape(-1, self.dimension)
+        cells, colliding = self.cells_of(configs)
+        pending = np.flatnonzero(~colliding)
+        for k, cache in enumerate(self.cache):
+            if len(pending) == 0:
+                break
+            keys = list(map(tuple, cells[pending, :k + 1].tolist()))
+            unknown = list({key for key in keys if key not in cache})
+            if len(unknown) > 0:
+                thetas = self.lower[:k + 1] + np.array(unknown) * self.spacing[:k + 1]
+                cache.update(zip(unknown, collision_mask(piece_triangles_batch(self.arm, thetas), self.obstacle_triangles, self.obstacle_bvh).tolist()))
+                self.checks += len(unknown)
+            hit = np.array([cache[key] for key in keys], dtype=bool)
+            colliding[pending[hit]] = True
+            pending = pending[~hit]
+
+        if self.self_collision and len(pending) > 0:
+            # the first joint turns the whole arm, it does not change a self-collision
+            keys = list(map(tuple, cells[pending, 1:].tolist()))
+            unknown = list({key for key in keys if key not in self.self_collision_cache})
+            if len(unknown) > 0:
+                thetas = np.zeros((len(unknown), self.dimension))
+                thetas[:, 1:] = self.lower[1:] + np.array(unknown) * self.spacing[1:]
+                self.self_collision_cache.update(zip(unknown, self_collision_mask_poses(self.arm, thetas).tolist()))
+                self.checks += len(unknown)
+            colliding[pending] = [self.self_collision_cache[key] for key in keys]
+        return colliding
+
+    def free_fraction(self, a, delta):
+        """
+        Fraction of the straight motion a -> a + delta that can be done before the first collision (a being free)
+        """
+        n = int(np.ceil(np.max(np.abs(delta) / self.spacing)))
+        if n == 0:
+            return 1.
+        fractions = np.arange(1, n + 1) / n
+        for start in range(0, n, self.BATCH_SIZE):
+            batch = fractions[start:start + self.BATCH_SIZE]
+            hits = np.flatnonzero(self.colliding(a + batch[:, None] * delta))
+            if len(hits) > 0:
+                k = start + hits[0]
+                return fractions[k - 1] if k > 0 else 0.
+        return 1.
+
+    def extend(self, tree, target, max_step):
+        """
+        Grows the tree toward target by at most max_step. Returns (index of the new node, target reached),
+        (None, False) when the tree cannot move toward it
+        """
+        kdtree, parents = tree
+        near, distance = kdtree.nearest(target)
+        origin = np.array(kdtree.points[near])
+        delta = self.difference(origin, target)
+        if distance > max_step:
+            delta *= max_step / distance
+        fraction = self.free_fraction(origin, delta)
+        if fraction == 0.:
+            return None, False
+        index = kdtree.insert(self.wrap(origin + fraction * delta))
+        parents.append(near)
+        return index, fraction == 1. and distance <= max_step
+
+    def connect(self, tree, target):
+        """
+        Extends the tree toward target until it is reached or blocked
+        """
+        while True:
+            index, reached = self.extend(tree, target, self.step_size)
+            if index is None or reached:
+                return index, reached
+
+    def branch(self, tree, index):
+        kdtree, parents = tree
+        out = []
+        while index != -1:
+            out.append(kdtree.points[index])
+            index = parents[index]
+        return out # from the node to the root
+
+    def sample(self):
+        return self.rng.uniform(self.lower, self.upper)
+
+    def plan(self, start_angles, goal_angles, shortcut_iterations=100):
+        """
+        Joint space path between two joint vectors, as an np.array (K, N) of angles, unwrapped along the path
+        like GridPlanner.plan. Returns None when the start or the goal collides, or when no path
+        was found in max_iterations
+        """
+        start = self.wrap(start_angles)
+        goal = self.wrap(goal_angles)
+        if self.colliding([start, goal]).any():
+            return None
+
+        trees = []
+        for root in (start, goal):
+            kdtree = KDTree(self.dimension, self.periods)
+            kdtree.insert(root)
+            trees.append((kdtree, [-1]))
+
+        path = None
+        if self.free_fraction(start, self.difference(start, goal)) == 1.:
+            path = [start, goal]
+        for iteration in range(self.max_iterations):
+            if path is not None:
+                break
+            tree, other = trees[iteration % 2], trees[1 - iteration % 2]
+            index, _ = self.extend(tree, self.sample(), self.step_size)
+            if index is None:
+                continue
+            other_index, reached = self.connect(other, tree[0].points[index])
+            if reached:
+                start_branch = self.branch(trees[0], index if tree is trees[0] else other_index)
+                goal_branch = self.branch(trees[1], other_index if tree is trees[0] else index)
+                path = start_branch[::-1] + goal_branch
+        if path is None:
+            return None
+
+        # continuous angles along the path, from the exact start to the exact goal
+        steps = self.difference(np.array(path[:-1]), np.array(path[1:]))
+        path = np.asarray(start_angles, dtype=float) + np.concatenate([np.zeros((1, self.dimension)), np.cumsum(steps, axis=0)])
+        path[-1] = path[-2] + self.difference(path[-2], goal_angles)
+        return self.shortcut(path, shortcut_iterations)
+
+    def shortcut(self, path, iterations):
+        """
+        Removes detours: replaces the part between two random points of the path by a straight motion when it is free
+        """
+        path = list(path)
+        for _ in range(iterations):
+            if len(path) <= 2:
+                break
+            i, j = sorted(self.rng.choice(len(path), size=2, replace=False))
+            if j - i > 1 and self.free_fraction(path[i], path[j] - path[i]) == 1.:
+                path = path[:i + 1] + path[j:]
+        return np.array(path)
@@ -4,6 +4,8 @@ import imgui
 from pathlib import Path
 import easygui
 import os
+import matplotlib.pyplot as plt
+import numpy as np
 
 from lib.BaseScene import BaseScene
 from lib.Math.Vector import Vector2 as V
@@ -13,6 +15,11 @@ import math
 
 from RoboticArm.RoboticArm import RoboticArm
 from RoboticArm.ObstaclesManager import ObstaclesManager
+from RoboticArm.CSPaceLayers import CSPaceLayers
+from RoboticArm.CSPaceCache import CSPaceCache
+from RoboticArm.CSPaceJob import CSPaceJob
+from RoboticArm.GridPlanner import GridPlanner
+from RoboticArm.SamplingPlanner import SamplingPlanner
 
 
 class Scene(BaseScene):
@@ -26,6 +33,15 @@ class Scene(BaseScene):
         self.arm = None
         self.theta2 = None
         self.theta1 = None
+        self.cspace = None
+        self.cspace_layers = None
+        self.cspace_job = None
+        self.planner = None
+        self.sampling_planner = None
+        self.goal = None
+        self.path = None
+        self.path_position = None
+        self.path_speed = None
         self.window_size = V(self.app.options.window.width, self.app.options.window.height)
 
     def global_frame_to_draw_frame(self, vector: V):
@@ -127,7 +143,7 @@ class Scene(BaseScene):
         attach = V(28, 2)
         self.theta1 = math.radians(10)
         self.theta2 = math.radians(-20)
-        self.arm = RoboticArm(V(0, 0), self.theta1, self.theta2, piece_size, piece_size, pivot, pivot, attach, attach)
+        self.arm = RoboticArm(V(0, 0), [self.theta1, self.theta2], [piece_size, piece_size], [pivot, pivot], [attach, attach])
 
         # Obstacles
         self.obstacles = ObstaclesManager()
@@ -138,28 +154,53 @@ class Scene(BaseScene):
         # imgui specific
         self.add_obstacle = False
 
+        # C-space, computed in the background, one layer per obstacle, cached on disk
+        angle = math.pi
+        n = 100
+        self.cspace = None
+        cache = CSPaceCache(Path(os.getcwd()) / self.options.obstacles_path / self.options.cspace_cache)
+        self.cspace_layers = CSPaceLayers(self.arm, [-angle, angle], [-angle, angle], n, cache=cache)
+        self.cspace_job = None
+
+        # Path planning over the C-space (once computed) or with RRT-Connect, the path is followed at path_speed (rad/s)
+        self.planner = None
+        self.sampling_planner = None
+        self.goal = [self.theta1, self.theta2]
+        self.path = None
+        self.path_position = 0.
+        self.path_speed = math.radians(60)
+
     def update(self, dt, events):
         # Robotic arm events
-        if events.on_first_check_intersection and not self.io.key_ctrl:
-            angle = math.pi
-            n = 100
-
+        if events.on_first_check_intersection and not self.io.key_ctrl and self.cspace_job is None:
             print('Compute CSPACE')
-            cspace = self.arm.computeCSPace([-angle, angle], [-angle, angle], n, self.obstacles)
-            print(cspace)
+            self.cspace_job = CSPaceJob(self.cspace_layers, self.obstacles, self.arm).start()
+
+        if self.cspace_job is not None and self.cspace_job.done:
+            self.on_cspace_job_done(self.cspace_job)
+            self.cspace_job = None
+
+        # keeps the matplotlib windows responsive without blocking the scene
+        if plt.get_fignums():
+            plt.gcf().canvas.flush_events()
+
+        if self.path is not None:
+            self.follow_path(dt)
 
         keys = pygame.key.get_pressed()
         if keys[K_LEFT] or keys[K_RIGHT] or keys[K_UP] or keys[K_DOWN]:
             speed = 40
+            self.path = None
+            theta1, theta2 = self.theta1, self.theta2
             if keys[K_LEFT]:
-                self.theta1 += dt * math.radians(speed)
+                theta1 += dt * math.radians(speed)
             if keys[K_RIGHT]:
-                self.theta1 -= dt * math.radians(speed)
+                theta1 -= dt * math.radians(speed)
             if keys[K_UP]:
-                self.theta2 += dt * math.radians(speed)
+                theta2 += dt * math.radians(speed)
             if keys[K_DOWN]:
-                self.theta2 -= dt * math.radians(speed)
-            self.arm.update_angles(self.theta1, self.theta2)
+                theta2 -= dt * math.radians(speed)
+            self.move_arm(theta1, theta2)
 
         # Obstacle events
         if events.on_first_new_obstacle and self.io.key_ctrl:
@@ -184,6 +225,67 @@ class Scene(BaseScene):
         if self.main_focus and events.on_first_confirm_new_obstacle and self.io.key_ctrl:
             self.obstacles.confirm_current()
 
+    def on_cspace_job_done(self, job):
+        if job.error is not None:
+            print(f'CSPACE computation failed: {job.error}')
+            return
+        if job.result is None:
+            print('CSPACE computation cancelled')
+            return
+
+        self.cspace = job.result
+        self.planner = GridPlanner(self.cspace)
+        print(self.cspace)
+
+        plt.figure()
+        plt.imshow(self.cspace.data.to_array())
+        plt.show(block=False)
+
+    def move_arm(self, theta1, theta2):
+        """
+        Moves the arm toward (theta1, theta2), stopping at the first contact with an obstacle on the way
+        """
+        start, end = (self.theta1, self.theta2), (theta1, theta2)
+        t = self.arm.first_contact(start, end, self.obstacles)
+        if t == 0.:
+            # already touching: only the motions that get away from the obstacles are allowed, up to their next contact
+            before = self.arm.clearance_at(start, self.obstacles).distance
+            after = self.arm.clearance_at(end, self.obstacles).distance
+            t = self.arm.first_contact_after_leaving(start, end, self.obstacles) if after > before else 0.
+        if t is not None:
+            theta1 = start[0] + t * (end[0] - start[0])
+            theta2 = start[1] + t * (end[1] - start[1])
+        self.theta1, self.theta2 = theta1, theta2
+        self.arm.update_angles(self.theta1, self.theta2)
+
+    def get_sampling_planner(self):
+        # the collision results it caches are only valid for the obstacles it was built with
+        if self.sampling_planner is None or self.sampling_planner.obstacle_triangles is not self.obstacles.get_triangles_array():
+            layers = self.cspace_layers
+            self.sampling_planner = SamplingPlanner(self.arm, self.obstacles, [layers.theta1_range, layers.theta2_range], 1024)
+        return self.sampling_planner
+
+    def plan_path(self, planner):
+        path = planner.plan((self.theta1, self.theta2), self.goal)
+        if path is None:
+            print('No path to the goal')
+            return
+        self.path = path
+        self.path_position = 0.
+
+    def follow_path(self, dt):
+        """
+        Moves the arm along self.path, at constant speed in the joint space
+        """
+        steps = np.linalg.norm(np.diff(self.path, axis=0), axis=1)
+        lengths = np.concatenate([[0.], np.cumsum(steps)])
+        self.path_position = min(self.path_position + dt * self.path_speed, lengths[-1])
+        self.theta1 = float(np.interp(self.path_position, lengths, self.path[:, 0]))
+        self.theta2 = float(np.interp(self.path_position, lengths, self.path[:, 1]))
+        self.arm.update_angles(self.theta1, self.theta2)
+        if self.path_position >= lengths[-1]:
+            self.path = None
+
     def physics_update(self, dt):
         pass
 
@@ -226,6 +328,13 @@ class Scene(BaseScene):
             if self.add_obstacle:
                 self.add_obstacle_imgui()
 
+            # C-space progress
+            if self.cspace_job is not None:
+                self.cspace_job_imgui()
+
+            # path planning
+            self.planner_imgui()
+
             # robot drawing
             self.draw_list = imgui.get_window_draw_list()
             self.arm.draw(self)
@@ -250,3 +359,37 @@ class Scene(BaseScene):
             if close:
                 self.add_obstacle = False
                 self.obstacles.reset_current()
+
+    def cspace_job_imgui(self):
+        with imgui.begin("C-space", imgui.WINDOW_NO_FOCUS_ON_APPEARING | imgui.WINDOW_NO_RESIZE):
+            imgui.set_window_size(0, 0)
+
+            if self.cspace_job.cancelled:
+                imgui.text("Cancelling...")
+            else:
+                imgui.text("Computing the C-space in the background")
+            imgui.progress_bar(self.cspace_job.progress, (300, 0), f"{self.cspace_job.progress * 100:.0f}%")
+
+            imgui.new_line()
+            cancel = imgui.button("Cancel", imgui.get_window_width() * 0.965)
+            if cancel:
+                self.cspace_job.cancel()
+
+    def planner_imgui(self):
+        with imgui.begin("Path planning", imgui.WINDOW_NO_FOCUS_ON_APPEARING | imgui.WINDOW_NO_RESIZE):
+            imgui.set_window_size(0, 0)
+
+            goal = [math.degrees(angle) for angle in self.goal]
+            changed, goal = imgui.slider_float2("Goal (deg)", *goal, -180., 180.)
+            if changed:
+                self.goal = [math.radians(angle) for angle in goal]
+
+            if self.planner is not None:
+                plan = imgui.button("Plan on the C-space", imgui.get_window_width() * 0.965)
+                if plan:
+                    self.plan_path(self.planner)
+            plan = imgui.button("Plan with RRT-Connect", imgui.get_window_width() * 0.965)
+            if plan:
+                self.plan_path(self.get_sampling_planner())
+            if self.path is not None:
+                imgui.text(f"Following a path of {len(self.path)} steps")
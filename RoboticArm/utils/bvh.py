@@ -0,0 +1,112 @@
+import numpy as np
+import heapq
+
+from RoboticArm.utils.mesh_generation import boxes_overlap, segment_box_overlap, box_distance
+
+
+class BVH:
+    """
+    Bounding volume hierarchy over a list of axis aligned boxes (min_x, min_y, max_x, max_y).
+    Built top-down by splitting the boxes at the median of their centers along the longest axis.
+    The queries return the indices (in the original list) of the boxes that overlap a box / a segment.
+    """
+    LEAF_SIZE = 4
+
+    def __init__(self, boxes):
+        self.boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        self.order = np.arange(len(self.boxes))
+
+        # flat node arrays, node 0 is the root. A leaf has left == -1 and owns order[start:start + count]
+        self.node_boxes = []
+        self.left = []
+        self.right = []
+        self.start = []
+        self.count = []
+        if len(self.boxes) > 0:
+            self._build(0, len(self.boxes))
+
+        self.box_list = [tuple(box) for box in self.boxes.tolist()] # python tuples, faster for the scalar queries
+        self.order_list = self.order.tolist()
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def _build(self, start, stop):
+        node = len(self.node_boxes)
+        boxes = self.boxes[self.order[start:stop]]
+        box = (boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max())
+        self.node_boxes.append(tuple(float(v) for v in box))
+        self.left.append(-1)
+        self.right.append(-1)
+        self.start.append(start)
+        self.count.append(stop - start)
+
+        if stop - start <= self.LEAF_SIZE:
+            return node
+
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        axis = int(np.argmax(box[2:] - np.array(box[:2])))
+        self.order[start:stop] = self.order[start:stop][np.argsort(centers[:, axis], kind='stable')]
+        middle = (start + stop) // 2
+
+        self.left[node] = self._build(start, middle)
+        self.right[node] = self._build(middle, stop)
+        return node
+
+    def _query(self, node_test):
+        out = []
+        if len(self.boxes) == 0:
+            return out
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if not node_test(self.node_boxes[node]):
+                continue
+            if self.left[node] == -1:
+                for k in range(self.start[node], self.start[node] + self.count[node]):
+                    i = self.order_list[k]
+                    if node_test(self.box_list[i]):
+                        out.append(i)
+            else:
+                stack.append(self.right[node])
+                stack.append(self.left[node])
+        return out
+
+    def query_box(self, box):
+        return self._query(lambda other: boxes_overlap(box, other))
+
+    def query_segment(self, P1, P2):
+        return self._query(lambda other: segment_box_overlap(P1, P2, other))
+
+    def nearest(self, box, exact):
+        """
+        Best-first search of the item closest to the content of `box`.
+        exact(i) must return a tuple whose first element is the (signed) distance to the item i,
+        the distance between the boxes is used as a lower bound to prune the nodes and items.
+        Returns the tuple of the closest item, or None when the BVH is empty
+        """
+        if len(self.boxes) == 0:
+            return None
+
+        def pruned(lower_bound, best):
+            # negative distances (penetrations) can only come from overlapping boxes
+            return best is not None and lower_bound > 0 and lower_bound >= best[0]
+
+        best = None
+        heap = [(box_distance(box, self.node_boxes[0]), 0)]
+        while heap:
+            lower_bound, node = heapq.heappop(heap)
+            if pruned(lower_bound, best):
+                break
+            if self.left[node] == -1:
+                for k in range(self.start[node], self.start[node] + self.count[node]):
+                    i = self.order_list[k]
+                    if pruned(box_distance(box, self.box_list[i]), best):
+                        continue
+                    result = exact(i)
+                    if best is None or result[0] < best[0]:
+                        best = result
+            else:
+                for child in (self.left[node], self.right[node]):
+                    heapq.heappush(heap, (box_distance(box, self.node_boxes[child]), child))
+        return best
@@ -0,0 +1,590 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from RoboticArm.utils.bvh import BVH
+from RoboticArm.utils.mesh_generation import box_distance
+
+# Batched equivalents of the scalar predicates of mesh_generation, run over whole arrays of triangles at once.
+# The separating axis tests project on the same edge normals as triangle_intersection_sat, and agree with it and with
+# the segment cascade (triangle_intersection_segments) on the regression corpus of test_triangle_intersection.py.
+# The distance and penetration batches use the same formulas as the scalar functions, equal up to rounding.
+# Points are np.array of shape (..., 2), triangles of shape (..., 3, 2).
+
+ARM_TRIANGLES = [[0, 1, 2], [0, 2, 3]] # same split as ArmPiece.get_arm_triangles
+CHUNK_SIZE = 1 << 16 # number of cells processed at once
+TILES_PER_WORKER = 4 # more tiles than workers, so that the pool stays balanced
+BVH_GROUP_SIZE = 256 # consecutive poses (close to each other in the grid) that share one query of the obstacle BVH
+ADAPTIVE_COARSE_STEP = 16 # largest spacing of the first lattice of compute_cspace_grid_adaptive, in cells
+ADAPTIVE_MIN_COARSE_CELLS = 32 # smallest number of cells per axis of that lattice
+
+
+def triangle_intersection_sat_batch(triangle, triangles):
+    """
+    Separating axis test of one triangle np.array (3, 2) against triangles np.array (..., 3, 2), returns np.array (...) of bool.
+    The pairs are dropped as soon as an axis separates them.
+    """
+    shape = triangles.shape[:-2]
+    x = triangles[..., 0].reshape(-1, 3)
+    y = triangles[..., 1].reshape(-1, 3)
+    alive = np.arange(len(x))
+
+    def keep(mask):
+        nonlocal x, y, alive
+        x, y, alive = x[mask], y[mask], alive[mask]
+
+    # the three axes of the single triangle are shared by all the pairs
+    for i in range(3):
+        A, B = triangle[i], triangle[(i + 1) % 3]
+        nx, ny = A[1] - B[1], B[0] - A[0]
+        proj_triangle = triangle[:, 0] * nx + triangle[:, 1] * ny
+        proj = x * nx + y * ny
+        keep((proj.max(axis=-1) >= proj_triangle.min()) & (proj_triangle.max() >= proj.min(axis=-1)))
+
+    for i in range(3):
+        j = (i + 1) % 3
+        nx, ny = (y[:, i] - y[:, j])[:, None], (x[:, j] - x[:, i])[:, None]
+        proj_triangle = triangle[:, 0] * nx + triangle[:, 1] * ny
+        proj = x * nx + y * ny
+        keep((proj.max(axis=-1) >= proj_triangle.min(axis=-1)) & (proj_triangle.max(axis=-1) >= proj.min(axis=-1)))
+
+    out = np.zeros(np.prod(shape, dtype=int), dtype=bool)
+    out[alive] = True
+    return out.reshape(shape)
+
+
+def triangle_pairs_intersection_sat_batch(P1, P2):
+    """
+    Separating axis test of the pairs of triangles (P1[k], P2[k]), np.array (..., 3, 2) each, returns np.array (...) of bool.
+    Same test as triangle_intersection_sat, the pairs are dropped as soon as an axis separates them.
+    """
+    shape = np.broadcast_shapes(P1.shape, P2.shape)[:-2]
+    P1 = np.broadcast_to(P1, shape + (3, 2)).reshape(-1, 3, 2)
+    P2 = np.broadcast_to(P2, shape + (3, 2)).reshape(-1, 3, 2)
+    x1, y1, x2, y2 = P1[..., 0], P1[..., 1], P2[..., 0], P2[..., 1]
+    alive = np.arange(len(x1))
+
+    def keep(mask):
+        nonlocal x1, y1, x2, y2, alive
+        x1, y1, x2, y2, alive = x1[mask], y1[mask], x2[mask], y2[mask], alive[mask]
+
+    for source in (0, 1):
+        for i in range(3):
+            j = (i + 1) % 3
+            x, y = (x1, y1) if source == 0 else (x2, y2)
+            nx, ny = (y[:, i] - y[:, j])[:, None], (x[:, j] - x[:, i])[:, None]
+            proj1 = x1 * nx + y1 * ny
+            proj2 = x2 * nx + y2 * ny
+            keep((proj1.max(axis=-1) >= proj2.min(axis=-1)) & (proj2.max(axis=-1) >= proj1.min(axis=-1)))
+
+    out = np.zeros(np.prod(shape, dtype=int), dtype=bool)
+    out[alive] = True
+    return out.reshape(shape)
+
+
+def piece_triangles_batch(arm, thetas):
+    """
+    Returns np.array (..., 2, 3, 2): the triangles of the k-th piece, for partial joint vectors thetas np.array (..., k)
+    (a piece only depends on the joints up to its own)
+    """
+    return arm.forward_kinematics(thetas).corners[..., -1, ARM_TRIANGLES, :]
+
+
+def arm_triangles_batch(arm, thetas):
+    """
+    Triangles of the arm for many poses at once (see RoboticArm.forward_kinematics)
+
+    Arguments:
+        arm: RoboticArm
+        thetas: np.array (..., N) -> joint vectors, each angle being relative to the previous piece
+    Returns:
+        np.array (..., 2N, 3, 2): the 2N triangles of the arm for each pose
+    """
+    return arm.forward_kinematics(thetas).triangles()
+
+
+def triangle_boxes_batch(triangles):
+    """
+    Returns the bounding boxes (min_x, min_y, max_x, max_y) of np.array (..., 3, 2) triangles, as np.array (..., 4)
+    """
+    return np.concatenate([triangles.min(axis=-2), triangles.max(axis=-2)], axis=-1)
+
+
+def boxes_overlap_batch(box1, box2):
+    return (box1[..., 0] <= box2[..., 2]) & (box2[..., 0] <= box1[..., 2]) & (box1[..., 1] <= box2[..., 3]) & (box2[..., 1] <= box1[..., 3])
+
+
+def triangles_bvh(obstacle_triangles):
+    """
+    BVH over the bounding boxes of np.array (T, 3, 2) obstacle triangles. The functions below take it along with
+    the triangles (ObstaclesManager.get_bvh, Obstacle.get_bvh), and only build it when it is not given
+    """
+    return BVH(triangle_boxes_batch(np.asarray(obstacle_triangles, dtype=float)).reshape(-1, 4))
+
+
+def pose_boxes_batch(arm_triangles):
+    """
+    Bounding boxes of the poses np.array (M, K, 3, 2), as np.array (M, 4)
+    """
+    boxes = triangle_boxes_batch(arm_triangles)
+    return np.concatenate([boxes[..., :2].min(axis=-2), boxes[..., 2:].max(axis=-2)], axis=-1)
+
+
+def group_boxes(pose_boxes, group_size=BVH_GROUP_SIZE):
+    """
+    Merged boxes of the groups of group_size consecutive poses, as a list of tuples
+    """
+    starts = np.arange(0, len(pose_boxes), group_size)
+    lower = np.minimum.reduceat(pose_boxes[:, :2], starts, axis=0)
+    upper = np.maximum.reduceat(pose_boxes[:, 2:], starts, axis=0)
+    return list(map(tuple, np.concatenate([lower, upper], axis=1).tolist()))
+
+
+def candidate_poses(bvh, pose_boxes, group_size=BVH_GROUP_SIZE):
+    """
+    Broad phase against the obstacle BVH, queried once per group of consecutive poses with the merged box of the group.
+    Returns a dict: obstacle triangle index -> np.array of the poses of the groups whose box overlaps its box
+    """
+    groups = {}
+    for g, box in enumerate(group_boxes(pose_boxes, group_size)):
+        for t in bvh.query_box(box):
+            groups.setdefault(t, []).append(g)
+    out = {}
+    for t in sorted(groups):
+        out[t] = np.concatenate([np.arange(g * group_size, min((g + 1) * group_size, len(pose_boxes))) for g in groups[t]])
+    return out
+
+
+def collision_mask(arm_triangles, obstacle_triangles, bvh=None):
+    """
+    Arguments:
+        arm_triangles: np.array (M, K, 3, 2) -> the K triangles of the arm for M poses
+        obstacle_triangles: np.array (T, 3, 2)
+        bvh: BVH of the obstacle triangles (see triangles_bvh)
+    Returns:
+        np.array (M,) of bool, True when the pose intersects any obstacle triangle
+    """
+    colliding = np.zeros(len(arm_triangles), dtype=bool)
+    if len(arm_triangles) == 0 or len(obstacle_triangles) == 0:
+        return colliding
+    if bvh is None:
+        bvh = triangles_bvh(obstacle_triangles)
+    pose_boxes = pose_boxes_batch(arm_triangles)
+    num_free = len(arm_triangles)
+    for t, poses in candidate_poses(bvh, pose_boxes).items():
+        if num_free == 0:
+            break
+        # only the poses still free, whose own bounding box overlaps the obstacle triangle, are tested
+        candidates = poses[~colliding[poses] & boxes_overlap_batch(pose_boxes[poses], bvh.boxes[t])]
+        if len(candidates) == 0:
+            continue
+        hit = triangle_intersection_sat_batch(obstacle_triangles[t], arm_triangles[candidates]).any(axis=-1)
+        colliding[candidates[hit]] = True
+        num_free -= int(hit.sum())
+    return colliding
+
+
+def self_collision_mask(arm_triangles, pairs):
+    """
+    Self-collision status of poses, with the same broad phase / narrow phase as collision_mask:
+    a pair of pieces is only tested for the poses where their bounding boxes overlap, then their triangles with SAT.
+
+    Arguments:
+        arm_triangles: np.array (M, 2N, 3, 2) -> the triangles of the arm for M poses (two per piece)
+        pairs: list of (i, j) -> the pairs of pieces to test (RoboticArm.self_collision_pairs)
+    Returns:
+        np.array (M,) of bool
+    """
+    M = len(arm_triangles)
+    piece_triangles = arm_triangles.reshape(M, -1, 2, 3, 2)
+    triangle_boxes = triangle_boxes_batch(piece_triangles)
+    piece_boxes = np.concatenate([triangle_boxes[..., :2].min(axis=-2), triangle_boxes[..., 2:].max(axis=-2)], axis=-1)
+
+    colliding = np.zeros(M, dtype=bool)
+    pending = np.arange(M)
+    for i, j in pairs:
+        if len(pending) == 0:
+            break
+        candidates = pending[boxes_overlap_batch(piece_boxes[pending, i], piece_boxes[pending, j])]
+        if len(candidates) == 0:
+            continue
+        hit = np.zeros(len(candidates), dtype=bool)
+        for a in range(2):
+            for b in range(2):
+                test = ~hit & boxes_overlap_batch(triangle_boxes[candidates, i, a], triangle_boxes[candidates, j, b])
+                hit[test] = triangle_pairs_intersection_sat_batch(piece_triangles[candidates[test], i, a], piece_triangles[candidates[test], j, b])
+        colliding[candidates[hit]] = True
+        pending = np.setdiff1d(pending, candidates[hit], assume_unique=True)
+    return colliding
+
+
+def self_collision_mask_poses(arm, thetas, chunk_size=CHUNK_SIZE):
+    """
+    Self-collision status of arbitrary poses, thetas being np.array (M, N) of joint vectors
+    """
+    thetas = np.asarray(thetas, dtype=float)
+    colliding = np.zeros(len(thetas), dtype=bool)
+    if len(arm.self_collision_pairs) == 0:
+        return colliding
+    for start in range(0, len(thetas), chunk_size):
+        stop = start + chunk_size
+        colliding[start:stop] = self_collision_mask(arm_triangles_batch(arm, thetas[start:stop]), arm.self_collision_pairs)
+    return colliding
+
+
+def compute_self_collision_grid(arm, theta1s, theta2s):
+    """
+    Self-collision layer of the C-space, np.array (len(theta1s), len(theta2s)) of bool.
+    theta1 turns the whole arm around its base, so it cannot change a self-collision:
+    each column is only checked once (with theta1 = 0)
+    """
+    theta1s = np.asarray(theta1s, dtype=float)
+    theta2s = np.asarray(theta2s, dtype=float)
+    columns = self_collision_mask_poses(arm, arm.joint_vectors(0., theta2s))
+    return np.broadcast_to(columns, (len(theta1s), len(theta2s))).copy()
+
+
+def chain_collision_mask(arm, obstacle_triangles, thetas, bvh=None, first_piece=0, shared_prefixes=True):
+    """
+    Collision status of joint vectors thetas np.array (M, N), checked piece by piece from the base:
+    a piece is only checked for the poses whose previous pieces are free.
+    The k-th piece only depends on the first k joints: with shared_prefixes, it is checked once per distinct
+    prefix, so the poses that only differ by their distal joints reuse the checks of the proximal pieces.
+    The pieces before first_piece are assumed to be free
+    """
+    thetas = np.asarray(thetas, dtype=float)
+    colliding = np.zeros(len(thetas), dtype=bool)
+    if len(obstacle_triangles) == 0:
+        return colliding
+    if bvh is None:
+        bvh = triangles_bvh(obstacle_triangles)
+    pending = np.arange(len(thetas))
+    for k in range(first_piece, thetas.shape[-1]):
+        if len(pending) == 0:
+            break
+        prefixes = thetas[pending, :k + 1]
+        if shared_prefixes:
+            prefixes, inverse = np.unique(prefixes, axis=0, return_inverse=True)
+            hit = collision_mask(piece_triangles_batch(arm, prefixes), obstacle_triangles, bvh)[inverse.ravel()]
+        else:
+            hit = collision_mask(piece_triangles_batch(arm, prefixes), obstacle_triangles, bvh)
+        colliding[pending[hit]] = True
+        pending = pending[~hit]
+    return colliding
+
+
+def compute_cspace_grid(arm, obstacle_triangles, theta1s, theta2s, bvh=None, chunk_size=CHUNK_SIZE):
+    """
+    Computes the occupancy grid of the C-space, one cell per (theta1, theta2) pair (the other joints keep their current angle).
+    The first piece only depends on theta1: it is checked once per row, the rows where it
+    collides are entirely blocked, and only the next pieces are checked on the remaining cells.
+
+    Returns:
+        np.array (len(theta1s), len(theta2s)) of bool
+    """
+    theta1s = np.asarray(theta1s, dtype=float)
+    theta2s = np.asarray(theta2s, dtype=float)
+    grid = np.zeros((len(theta1s), len(theta2s)), dtype=bool)
+    if len(obstacle_triangles) == 0 or grid.size == 0:
+        return grid
+    if bvh is None:
+        bvh = triangles_bvh(obstacle_triangles)
+
+    link1_colliding = collision_mask(piece_triangles_batch(arm, theta1s[:, None]), obstacle_triangles, bvh)
+    grid[link1_colliding] = True
+
+    free_rows = np.flatnonzero(~link1_colliding)
+    rows_per_chunk = max(1, chunk_size // len(theta2s))
+    for start in range(0, len(free_rows), rows_per_chunk):
+        rows = free_rows[start:start + rows_per_chunk]
+        t1, t2 = np.meshgrid(theta1s[rows], theta2s, indexing='ij')
+        thetas = arm.joint_vectors(t1.ravel(), t2.ravel())
+        grid[rows] = chain_collision_mask(arm, obstacle_triangles, thetas, bvh, first_piece=1, shared_prefixes=False).reshape(t1.shape)
+    return grid
+
+
+# Multi-process computation: the theta1 axis is split in tiles of rows.
+# The arm, the obstacle triangles (and their BVH) and the sample axes are sent once to each worker
+# (through the pool initializer), a tile is then only described by its row range.
+_worker_state = {}
+
+def _init_worker(arm, obstacle_triangles, bvh, theta1s, theta2s):
+    _worker_state["arm"] = arm
+    _worker_state["obstacle_triangles"] = obstacle_triangles
+    _worker_state["bvh"] = bvh
+    _worker_state["theta1s"] = theta1s
+    _worker_state["theta2s"] = theta2s
+
+
+def _compute_tile(start, stop):
+    theta1s = _worker_state["theta1s"][start:stop]
+    return start, compute_cspace_grid(_worker_state["arm"], _worker_state["obstacle_triangles"], theta1s, _worker_state["theta2s"], _worker_state["bvh"])
+
+
+def split_in_tiles(num_rows, num_tiles):
+    bounds = np.linspace(0, num_rows, min(num_tiles, num_rows) + 1).astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def iter_cspace_tiles(arm, obstacle_triangles, theta1s, theta2s, workers=1, num_tiles=None, bvh=None):
+    """
+    Computes the grid tile by tile, yields (start_row, tile) as soon as each tile is done.
+    Closing the generator early cancels the tiles that are not started yet
+    """
+    theta1s = np.asarray(theta1s, dtype=float)
+    theta2s = np.asarray(theta2s, dtype=float)
+    if bvh is None:
+        bvh = triangles_bvh(obstacle_triangles)
+    if num_tiles is None:
+        num_tiles = workers * TILES_PER_WORKER
+    tiles = split_in_tiles(len(theta1s), num_tiles)
+
+    if workers <= 1:
+        for start, stop in tiles:
+            yield start, compute_cspace_grid(arm, obstacle_triangles, theta1s[start:stop], theta2s, bvh)
+        return
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               initargs=(arm, obstacle_triangles, bvh, theta1s, theta2s))
+    try:
+        futures = [pool.submit(_compute_tile, start, stop) for start, stop in tiles]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def compute_cspace_grid_parallel(arm, obstacle_triangles, theta1s, theta2s, workers, bvh=None):
+    """
+    Same as compute_cspace_grid, but the rows are computed by a pool of `workers` processes
+    """
+    if workers <= 1:
+        return compute_cspace_grid(arm, obstacle_triangles, theta1s, theta2s, bvh)
+
+    grid = np.zeros((len(theta1s), len(theta2s)), dtype=bool)
+    for start, tile in iter_cspace_tiles(arm, obstacle_triangles, theta1s, theta2s, workers, bvh=bvh):
+        grid[start:start + len(tile)] = tile
+    return grid
+
+
+def collision_mask_poses(arm, obstacle_triangles, thetas, bvh=None, chunk_size=CHUNK_SIZE):
+    """
+    Collision status of arbitrary poses, thetas being np.array (M, N) of joint vectors (see chain_collision_mask)
+    """
+    thetas = np.asarray(thetas, dtype=float)
+    colliding = np.zeros(len(thetas), dtype=bool)
+    if len(obstacle_triangles) == 0:
+        return colliding
+    if bvh is None:
+        bvh = triangles_bvh(obstacle_triangles)
+    for start in range(0, len(thetas), chunk_size):
+        stop = start + chunk_size
+        colliding[start:stop] = chain_collision_mask(arm, obstacle_triangles, thetas[start:stop], bvh)
+    return colliding
+
+
+def _dilate(mask, periodic=(False, False)):
+    # 8-neighbourhood dilation of a 2D boolean mask, wrapping around the periodic axes
+    out = mask.copy()
+    for axis in (0, 1):
+        rows = out.copy()
+        if periodic[axis]:
+            out |= np.roll(rows, 1, axis=axis) | np.roll(rows, -1, axis=axis)
+        elif axis == 0:
+            out[1:] |= rows[:-1]
+            out[:-1] |= rows[1:]
+        else:
+            out[:, 1:] |= rows[:, :-1]
+            out[:, :-1] |= rows[:, 1:]
+    return out
+
+
+def adaptive_coarse_step(N1, N2, coarse_step=ADAPTIVE_COARSE_STEP):
+    """
+    Power of two at most coarse_step, leaving at least ADAPTIVE_MIN_COARSE_CELLS coarse cells along both axes
+    """
+    step = max(1, min(int(coarse_step), min(N1, N2) // ADAPTIVE_MIN_COARSE_CELLS))
+    return 1 << (step.bit_length() - 1)
+
+
+def compute_cspace_grid_adaptive(arm, obstacle_triangles, theta1s, theta2s, coarse_step=ADAPTIVE_COARSE_STEP,
+                                 periodic=(False, False), stats=None, bvh=None):
+    """
+    Same grid as compute_cspace_grid, computed with a quadtree refinement instead of checking every cell.
+
+    The grid points are first sampled every `step` cells, step being coarse_step reduced so that there are at least
+    ADAPTIVE_MIN_COARSE_CELLS coarse cells per axis (see adaptive_coarse_step). A quadtree cell whose four corners
+    agree is filled with their value, unless it touches a cell whose corners disagree (it may then contain
+    an obstacle boundary): those are split in 4, down to single cells. Small grids, where the step would be
+    below 4, are computed in full.
+    Thin features smaller than the coarse cells and far from any boundary can be missed.
+
+    periodic: per axis, True when the samples cover a full turn without its end (see sample_angles): the last
+    coarse cell then goes across the seam, its far corners being the first samples
+    stats: optional dict, receives the number of collision checks in stats["checks"]
+    """
+    theta1s = np.asarray(theta1s, dtype=float)
+    theta2s = np.asarray(theta2s, dtype=float)
+    N1, N2 = len(theta1s), len(theta2s)
+    step = adaptive_coarse_step(N1, N2, coarse_step)
+    if step < 4:
+        if stats is not None:
+            stats["checks"] = N1 * N2
+        return compute_cspace_grid(arm, obstacle_triangles, theta1s, theta2s, bvh)
+    if bvh is None:
+        bvh = triangles_bvh(obstacle_triangles)
+
+    known = np.full((N1, N2), -1, dtype=np.int8)
+    checks = 0
+
+    def evaluate(rows, cols):
+        nonlocal checks
+        unknown = known[rows, cols] < 0
+        rows, cols = rows[unknown], cols[unknown]
+        known[rows, cols] = collision_mask_poses(arm, obstacle_triangles, arm.joint_vectors(theta1s[rows], theta2s[cols]), bvh)
+        checks += len(rows)
+
+    def num_cells(step):
+        # coarse cells along each axis: the periodic axes have one more, across the seam
+        return tuple(-(-(N if wrap else N - 1) // step) for N, wrap in zip((N1, N2), periodic))
+
+    def lattice(n, step, N, wrap):
+        # positions of the corners of n cells, up to N (the first sample again) on a periodic axis, N - 1 otherwise
+        return np.minimum(np.arange(n + 1) * step, N if wrap else N - 1)
+
+    active = np.ones(num_cells(step), dtype=bool)
+    while True:
+        li = lattice(active.shape[0], step, N1, periodic[0])
+        lj = lattice(active.shape[1], step, N2, periodic[1])
+
+        corners = np.zeros((active.shape[0] + 1, active.shape[1] + 1), dtype=bool)
+        corners[:-1, :-1] |= active
+        corners[1:, :-1] |= active
+        corners[:-1, 1:] |= active
+        corners[1:, 1:] |= active
+        ci, cj = np.nonzero(corners)
+        evaluate(li[ci] % N1, lj[cj] % N2)
+
+        values = known[np.ix_(li % N1, lj % N2)]
+        mixed = active & ((values[:-1, :-1] != values[1:, :-1]) | (values[:-1, :-1] != values[:-1, 1:]) | (values[:-1, :-1] != values[1:, 1:]))
+        refine = _dilate(mixed, periodic) & active if step > 1 else np.zeros_like(active)
+
+        # fill the uniform cells with their corner value (the corners across the seam are already known)
+        for a, b in zip(*np.nonzero(active & ~refine)):
+            block = known[li[a]:li[a + 1] + 1, lj[b]:lj[b + 1] + 1]
+            block[block < 0] = values[a, b]
+
+        if not refine.any():
+            break
+        step //= 2
+        shape = num_cells(step)
+        active = np.repeat(np.repeat(refine, 2, axis=0), 2, axis=1)[:shape[0], :shape[1]]
+
+    if stats is not None:
+        stats["checks"] = checks
+    return known > 0
+
+
+def point_segment_distance_batch(point, A, B):
+    AB = B - A
+    length_sqr = (AB * AB).sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.clip(((point - A) * AB).sum(axis=-1) / length_sqr, 0., 1.)
+    t = np.where(length_sqr == 0, 0., t)
+    closest = A + AB * t[..., None]
+    return np.sqrt(((point - closest) ** 2).sum(axis=-1))
+
+
+def triangle_distance_batch(triangle, triangles):
+    """
+    Distance between one triangle np.array (3, 2) and triangles np.array (..., 3, 2), assuming they do not intersect
+    """
+    distance = np.full(triangles.shape[:-2], np.inf)
+    for i in range(3):
+        for j in range(3):
+            A, B = triangle[j], triangle[(j + 1) % 3]
+            distance = np.minimum(distance, point_segment_distance_batch(triangles[..., i, :], A, B))
+            distance = np.minimum(distance, point_segment_distance_batch(triangle[i], triangles[..., j, :], triangles[..., (j + 1) % 3, :]))
+    return distance
+
+
+def triangle_penetration_batch(triangle, triangles):
+    """
+    Smallest overlap of the projections of the triangle and of the triangles on the unit edge normals,
+    ie the penetration depth for the intersecting pairs (it is negative for the disjoint ones).
+    Like triangle_penetration, the zero length edges are skipped and pairs of points have a depth of 0
+    """
+    depth = np.full(triangles.shape[:-2], np.inf)
+    for T in (np.broadcast_to(triangle, triangles.shape), triangles):
+        for i in range(3):
+            d = T[..., (i + 1) % 3, :] - T[..., i, :]
+            n = np.stack([-d[..., 1], d[..., 0]], axis=-1)
+            length = np.linalg.norm(n, axis=-1, keepdims=True)
+            n = n / np.where(length > 0, length, 1.)
+
+            proj = (triangles * n[..., None, :]).sum(axis=-1)
+            proj_triangle = (triangle * n[..., None, :]).sum(axis=-1)
+            overlap = np.minimum(proj_triangle.max(axis=-1) - proj.min(axis=-1), proj.max(axis=-1) - proj_triangle.min(axis=-1))
+            depth = np.minimum(depth, np.where(length[..., 0] > 0, overlap, np.inf))
+    return np.where(np.isinf(depth), 0., depth)
+
+
+def clearance_batch(arm, obstacle_triangles, thetas, bvh=None, chunk_size=CHUNK_SIZE // 4):
+    """
+    Signed distance between the arm and the obstacles for many poses, negative when colliding (minus the penetration depth).
+    The obstacle triangles come from the BVH, per group of consecutive poses: the colliding poses are only compared
+    to the triangles whose boxes overlap theirs, and the free poses to the triangles within the best distance found
+    so far (the query box is grown until it covers it). A triangle is only evaluated for the poses where the distance
+    between the boxes (a lower bound) is smaller than their best distance.
+
+    Arguments:
+        thetas: np.array (M, N) -> joint vectors
+        bvh: BVH of the obstacle triangles (see triangles_bvh)
+    Returns:
+        np.array (M,) of float, inf when there is no obstacle
+    """
+    thetas = np.asarray(thetas, dtype=float)
+    out = np.full(len(thetas), np.inf)
+    if len(obstacle_triangles) == 0:
+        return out
+    if bvh is None:
+        bvh = triangles_bvh(obstacle_triangles)
+
+    for start in range(0, len(thetas), chunk_size):
+        stop = start + chunk_size
+        arm_triangles = arm_triangles_batch(arm, thetas[start:stop])
+        pose_boxes = pose_boxes_batch(arm_triangles)
+        colliding = collision_mask(arm_triangles, obstacle_triangles, bvh)
+
+        # colliding poses: deepest penetration over the triangles whose boxes overlap
+        depth = np.zeros(len(arm_triangles))
+        hits = np.flatnonzero(colliding)
+        for t, poses in candidate_poses(bvh, pose_boxes[hits]).items():
+            poses = hits[poses[boxes_overlap_batch(pose_boxes[hits[poses]], bvh.boxes[t])]]
+            if len(poses) > 0:
+                penetration = triangle_penetration_batch(obstacle_triangles[t], arm_triangles[poses]).max(axis=-1)
+                depth[poses] = np.maximum(depth[poses], penetration)
+
+        # free poses: closest obstacle triangle
+        best = np.full(len(arm_triangles), np.inf)
+        free = np.flatnonzero(~colliding)
+        for g, box in enumerate(group_boxes(pose_boxes[free])):
+            poses = free[g * BVH_GROUP_SIZE:(g + 1) * BVH_GROUP_SIZE]
+            done = set()
+            margin = 0.
+            while True:
+                query = (box[0] - margin, box[1] - margin, box[2] + margin, box[3] + margin)
+                candidates = [t for t in bvh.query_box(query) if t not in done]
+                for t in sorted(candidates, key=lambda t: box_distance(box, bvh.box_list[t])):
+                    gap = np.maximum(0., np.maximum(bvh.boxes[t, :2] - pose_boxes[poses, 2:], pose_boxes[poses, :2] - bvh.boxes[t, 2:]))
+                    close = poses[np.sqrt((gap ** 2).sum(axis=-1)) < best[poses]]
+                    if len(close) > 0:
+                        best[close] = np.minimum(best[close], triangle_distance_batch(obstacle_triangles[t], arm_triangles[close]).min(axis=-1))
+                done.update(candidates)
+                # the triangles outside of the query box are farther than margin from all the poses of the group
+                worst = best[poses].max()
+                if len(done) == len(obstacle_triangles) or worst <= margin:
+                    break
+                margin = worst if np.isfinite(worst) else max(2 * margin, box[2] - box[0], box[3] - box[1], 1e-9)
+
+        out[start:stop] = np.where(colliding, -depth, best)
+    return out
@@ -0,0 +1,185 @@
+import math
+import random
+from lib.Math.Vector import Vector2 as V
+
+from RoboticArm.utils.mesh_generation import orientation, in_circumcircle, triangle_edges
+
+
+class DelaunayTriangulation:
+    """
+    Bowyer-Watson triangulation kept between the edits of a point set: a point is inserted (or removed)
+    by only re-triangulating the triangles around it, instead of triangulating all the points again.
+    The triangulation covers a super triangle containing all the points (vertices 0, 1, 2), get_triangles() drops
+    the triangles that use one of its vertices.
+
+    The vertices are stored in a list and referred to by their index. The triangles are counterclockwise tuples
+    of indices (a, b, c), the mesh is stored as half-edges: edges[(a, b)] is the triangle with the directed edge
+    a -> b, so the neighbour across that edge is edges[(b, a)]. The triangle containing a new point is found by
+    walking toward it from the last created triangle, and the bad triangles (the cavity) by a breadth first search
+    from there. The orientation and in-circle predicates are exact (see mesh_generation.in_circumcircle).
+    """
+    SUPER_SIZE = 99999999999.0
+
+    def __init__(self, points=()):
+        S = self.SUPER_SIZE
+        self.vertices = [V(-S, -S), V(S, 0.0), V(0.0, S)]
+        self.triangles = {} # triangle -> None, an ordered set
+        self.edges = {}
+        self.vertex_triangle = [None] * 3 # vertex -> one of its triangles, None once removed
+        self.last = None # where the next walk starts
+        self.add_triangle((0, 1, 2))
+        self.insert_many(points)
+
+    def insert_many(self, points):
+        """
+        Adds a batch of points, in an order that keeps the walks short. Returns their vertex indices, in the given order
+        """
+        indices = [None] * len(points)
+        for k in self.spatial_order(points):
+            indices[k] = self.insert(points[k])
+        return indices
+
+    @staticmethod
+    def spatial_order(points):
+        """
+        Insertion order of a batch of points (as indices in the list): column by column in a zig-zag
+        """
+        if len(points) < 3:
+            return list(range(len(points)))
+        min_x = min(p.x for p in points)
+        width = max(p.x for p in points) - min_x
+        columns = max(1, int(math.sqrt(len(points) / 2)))
+        def key(k):
+            p = points[k]
+            column = min(columns - 1, int((p.x - min_x) / width * columns)) if width > 0 else 0
+            return column, p.y if column % 2 == 0 else -p.y
+        return sorted(range(len(points)), key=key)
+
+    def corners(self, triangle):
+        a, b, c = triangle
+        return self.vertices[a], self.vertices[b], self.vertices[c]
+
+    def add_triangle(self, triangle):
+        a, b, c = triangle
+        self.triangles[triangle] = None
+        self.edges[(a, b)] = self.edges[(b, c)] = self.edges[(c, a)] = triangle
+        self.vertex_triangle[a] = self.vertex_triangle[b] = self.vertex_triangle[c] = triangle
+        self.last = triangle
+
+    def remove_triangle(self, triangle):
+        a, b, c = triangle
+        del self.triangles[triangle]
+        del self.edges[(a, b)], self.edges[(b, c)], self.edges[(c, a)]
+
+    def locate(self, point):
+        """
+        Triangle containing the point, by walking across the edges that separate the current triangle from it
+        """
+        vertices = self.vertices
+        triangle = self.last
+        while True:
+            edges = triangle_edges(triangle)
+            start = random.randrange(3) # prevents cycling on degenerate configurations
+            for k in range(3):
+                a, b = edges[(start + k) % 3]
+                if orientation(vertices[a], vertices[b], point) < 0:
+                    neighbour = self.edges.get((b, a))
+                    if neighbour is not None:
+                        triangle = neighbour
+                        break
+            else:
+                return triangle
+
+    def insert(self, point):
+        """
+        Adds a point, returns its vertex index. A point at the same place as a vertex is not added,
+        the index of that vertex is returned
+        """
+        start = self.locate(point)
+        for i in start:
+            if self.vertices[i].x == point.x and self.vertices[i].y == point.y:
+                return i
+        index = len(self.vertices)
+        self.vertices.append(point)
+        self.vertex_triangle.append(None)
+
+        # a) the bad triangles, whose circumcircle contains the point, form a cavity around the triangle containing it
+        cavity = {start}
+        stack = [start]
+        polygon = []
+        while stack:
+            triangle = stack.pop()
+            for a, b in triangle_edges(triangle):
+                neighbour = self.edges.get((b, a))
+                if neighbour in cavity:
+                    continue
+                if neighbour is not None and in_circumcircle(point, self.corners(neighbour)) >= 0:
+                    cavity.add(neighbour)
+                    stack.append(neighbour)
+                else:
+                    polygon.append((a, b)) # b) boundary of the cavity
+
+        # c) remove the bad triangles, d) re-triangulate the cavity around the point
+        for triangle in cavity:
+            self.remove_triangle(triangle)
+        for a, b in polygon:
+            self.add_triangle((a, b, index))
+        return index
+
+    def star(self, index):
+        """
+        Vertices around a vertex of the triangulation, counterclockwise
+        """
+        a, b, c = self.vertex_triangle[index]
+        triangle = (a, b, c) if a == index else (b, c, a) if b == index else (c, a, b)
+        ring = []
+        while True:
+            _, a, b = triangle
+            ring.append(a)
+            if b == ring[0]:
+                return ring
+            a, b, c = self.edges[(index, b)]
+            triangle = (a, b, c) if a == index else (b, c, a) if b == index else (c, a, b)
+
+    def remove(self, index):
+        """
+        Removes a vertex: the hole left by its triangles (star-shaped around it) is filled back with Delaunay ears
+        """
+        if index < 3 or self.vertex_triangle[index] is None:
+            return
+        ring = self.star(index)
+        for k in range(len(ring)):
+            self.remove_triangle(self.edges[(index, ring[k])])
+        self.vertex_triangle[index] = None
+        for triangle in self.fill_star_hole(ring):
+            self.add_triangle(triangle)
+
+    def fill_star_hole(self, ring):
+        """
+        Delaunay triangulation of a star-shaped polygon given counterclockwise: an ear (convex corner) is clipped
+        when its circumcircle contains no other vertex of the polygon (vertices on the circle do not count)
+        """
+        vertices = self.vertices
+        ring = list(ring)
+        out = []
+        while len(ring) > 3:
+            n = len(ring)
+            ears = [i for i in range(n) if orientation(vertices[ring[i - 1]], vertices[ring[i]], vertices[ring[(i + 1) % n]]) > 0]
+            for i in ears:
+                ear = (ring[i - 1], ring[i], ring[(i + 1) % n])
+                corners = self.corners(ear)
+                if not any(in_circumcircle(vertices[v], corners) > 0 for v in ring if v not in ear):
+                    break
+            else:
+                i = ears[0] if len(ears) > 0 else 0 # cocircular vertices: any ear is Delaunay
+            out.append((ring[i - 1], ring[i], ring[(i + 1) % n]))
+            ring.pop(i)
+        if len(ring) == 3:
+            out.append(tuple(ring))
+        return out
+
+    def get_triangles(self):
+        """
+        The triangles of the points, as counterclockwise tuples of vertex indices
+        """
+        return [triangle for triangle in self.triangles if min(triangle) >= 3]
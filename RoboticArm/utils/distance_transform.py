@@ -0,0 +1,88 @@
+import numpy as np
+
+# Exact euclidean distance transform (Felzenszwalb & Huttenlocher, "Distance Transforms of Sampled Functions"):
+# the 2D transform is two 1D passes, each one computing the lower envelope of the parabolas
+# w²(p - q)² + f(q) in linear time. The envelope is built for all the rows at once.
+
+INF = 1e20
+
+
+def _lower_envelope_rows(f, w):
+    """
+    1D squared distance transform of each row of f (R, n), with a spacing w between the samples:
+        out[r, p] = min_q w²(p - q)² + f[r, q]
+    """
+    R, n = f.shape
+    w2 = w * w
+    rows = np.arange(R)
+    q_sqr = w2 * np.arange(n, dtype=float) ** 2
+
+    v = np.zeros((R, n), dtype=np.int64) # abscissas of the parabolas of the envelope
+    z = np.full((R, n + 1), np.inf) # boundaries between them
+    z[:, 0] = -np.inf
+    k = np.zeros(R, dtype=np.int64) # index of the last parabola
+
+    for q in range(1, n):
+        todo = rows
+        s = np.empty(R)
+        while len(todo) > 0:
+            vk = v[todo, k[todo]]
+            s_todo = ((f[todo, q] + q_sqr[q]) - (f[todo, vk] + q_sqr[vk])) / (2 * w2 * (q - vk))
+            pop = s_todo <= z[todo, k[todo]]
+            s[todo[~pop]] = s_todo[~pop]
+            todo = todo[pop]
+            k[todo] -= 1
+        k += 1
+        v[rows, k] = q
+        z[rows, k] = s
+        z[rows, k + 1] = np.inf
+
+    out = np.empty((R, n))
+    k[:] = 0
+    for p in range(n):
+        todo = rows[z[rows, k + 1] < p]
+        while len(todo) > 0:
+            k[todo] += 1
+            todo = todo[z[todo, k[todo] + 1] < p]
+        vk = v[rows, k]
+        out[:, p] = w2 * (p - vk) ** 2 + f[rows, vk]
+    return out
+
+
+def _transform_axis(f, axis, spacing, period):
+    """
+    Runs the 1D transform along `axis`. With a period, the domain wraps around: half a period of samples
+    is copied on each side, so that every point sees the closest copy of each site (at most half a period away)
+    """
+    f = np.moveaxis(f, axis, -1)
+    if period is None:
+        out = _lower_envelope_rows(f, spacing)
+    else:
+        n = f.shape[-1]
+        pad = min(period, period // 2 + 1)
+        wrapped = f[:, np.arange(-pad, period + pad) % period]
+        distinct = _lower_envelope_rows(wrapped, spacing)[:, pad:pad + period]
+        out = distinct[:, np.arange(n) % period] # samples past the period are copies of the first ones
+    return np.moveaxis(out, -1, axis)
+
+
+def euclidean_distance_transform(occupied, spacing=(1., 1.), periods=(None, None)):
+    """
+    Distance from every cell to the closest occupied cell (0 on the occupied cells, inf when there is none).
+
+    Arguments:
+        occupied: np.array (N1, N2) of bool
+        spacing: distance between two samples along each axis
+        periods: number of distinct samples along each axis when it wraps around (None when it does not),
+                 the samples after the period being copies of the first ones
+    Returns:
+        np.array (N1, N2) of float32
+    """
+    occupied = np.asarray(occupied, dtype=bool)
+    if not occupied.any():
+        return np.full(occupied.shape, np.inf, dtype=np.float32)
+
+    f = np.where(occupied, 0., INF)
+    f = _transform_axis(f, 0, spacing[0], periods[0])
+    f = _transform_axis(f, 1, spacing[1], periods[1])
+    return np.sqrt(f).astype(np.float32)
@@ -0,0 +1,101 @@
+class KDTree:
+    """
+    Incremental k-d tree over points of dimension k, for the nearest neighbour queries of the sampling planners.
+    The points are inserted one at a time (the tree is not rebalanced, random insertions keep it shallow).
+    Along the axes that have a period, the distance is measured around the wrap (shortest way), and the subtrees
+    on the other side of a split are pruned with the shortest way to reach them.
+    """
+    def __init__(self, dimension=2, periods=None):
+        self.dimension = dimension
+        self.periods = periods if periods is not None else [None] * dimension
+
+        # flat node arrays, node k holds points[k] and splits along axis[k]. -1 when there is no child
+        self.points = []
+        self.axis = []
+        self.left = []
+        self.right = []
+
+        self.lower = [float('inf')] * dimension # bounding box of the points
+        self.upper = [-float('inf')] * dimension
+
+    def __len__(self):
+        return len(self.points)
+
+    def insert(self, point):
+        """
+        Adds a point, returns its index
+        """
+        point = tuple(float(v) for v in point)
+        index = len(self.points)
+        self.points.append(point)
+        self.left.append(-1)
+        self.right.append(-1)
+        for a in range(self.dimension):
+            self.lower[a] = min(self.lower[a], point[a])
+            self.upper[a] = max(self.upper[a], point[a])
+
+        if index == 0:
+            self.axis.append(0)
+            return index
+
+        node = 0
+        while True:
+            a = self.axis[node]
+            children = self.left if point[a] < self.points[node][a] else self.right
+            if children[node] == -1:
+                children[node] = index
+                self.axis.append((a + 1) % self.dimension)
+                return index
+            node = children[node]
+
+    def _axis_distance(self, a, diff):
+        period = self.periods[a]
+        if period is None:
+            return abs(diff)
+        diff = abs(diff) % period
+        return min(diff, period - diff)
+
+    def _far_bound(self, a, query, split):
+        """
+        Lower bound of the distance along axis a between query and the points on the other side of split than query
+        """
+        gap = abs(query - split)
+        period = self.periods[a]
+        if period is None:
+            return gap
+        # the farthest of these points from the query (the bound of the box), reached the other way around
+        end = self.upper[a] if query < split else self.lower[a]
+        return min(gap, max(0., period - abs(end - query)))
+
+    def nearest(self, query):
+        """
+        Index of the closest point and its distance, (-1, inf) when the tree is empty
+        """
+        if len(self.points) == 0:
+            return -1, float('inf')
+        query = tuple(float(v) for v in query)
+        points, axis, left, right = self.points, self.axis, self.left, self.right
+        dimensions = range(self.dimension)
+        best, best_index = float('inf'), -1
+        stack = [(0, 0.)]
+        while stack:
+            node, bound = stack.pop()
+            if bound >= best:
+                continue
+            point = points[node]
+            d = 0.
+            for a in dimensions:
+                diff = self._axis_distance(a, query[a] - point[a])
+                d += diff * diff
+            if d < best:
+                best, best_index = d, node
+
+            a = axis[node]
+            split = point[a]
+            near, far = (left[node], right[node]) if query[a] < split else (right[node], left[node])
+            if far != -1:
+                gap = self._far_bound(a, query[a], split)
+                stack.append((far, gap * gap))
+            if near != -1:
+                stack.append((near, bound))
+        return best_index, best ** 0.5
@@ -1,4 +1,5 @@
 import numpy as np
+from fractions import Fraction
 from lib.Math.Vector import Vector2 as V
 
 from RoboticArm.colors import *
@@ -16,6 +17,87 @@ def welzl(P, R):
     return welzl(P[1:], R + [p])
 
 def triangle_intersection(P1, P2):
+    return triangle_intersection_sat(P1, P2)
+
+def triangle_intersection_sat(P1, P2):
+    """
+    Separating axis test: two (non degenerate) triangles are disjoint iff their projections on
+    one of the six edge normals are disjoint. Touching triangles intersect.
+    """
+    for T in (P1, P2):
+        for i in range(3):
+            A, B = T[i], T[(i + 1) % 3]
+            nx, ny = A.y - B.y, B.x - A.x # normal of the edge AB
+
+            proj1 = [p.x * nx + p.y * ny for p in P1]
+            proj2 = [p.x * nx + p.y * ny for p in P2]
+            if max(proj1) < min(proj2) or max(proj2) < min(proj1):
+                return False
+    return True
+
+def closest_point_on_segment(point, A, B):
+    AB = B - A
+    length_sqr = AB.mag_sqr()
+    if length_sqr == 0:
+        return A
+    t = max(0., min(1., (point - A).dot(AB) / length_sqr))
+    return A + AB * t
+
+def triangle_penetration(P1, P2):
+    """
+    Penetration depth of two intersecting triangles: the smallest overlap of their projections on the (unit) edge normals.
+    Returns (depth, Q1, Q2): Q2 is the deepest vertex of P2, and Q1 = Q2 moved by depth along the separation direction.
+    Zero length edges have no normal and are skipped, two triangles reduced to points have a depth of 0
+    """
+    depth, direction = None, None
+    for T in (P1, P2):
+        for i in range(3):
+            A, B = T[i], T[(i + 1) % 3]
+            n = V(A.y - B.y, B.x - A.x)
+            if n.mag_sqr() == 0:
+                continue
+            n = n.normalize()
+
+            proj1 = [p.dot(n) for p in P1]
+            proj2 = [p.dot(n) for p in P2]
+            forward = max(proj1) - min(proj2) # P2 moved by forward along n separates them
+            backward = max(proj2) - min(proj1) # or by backward along -n
+            overlap, axis = (forward, n) if forward <= backward else (backward, -n)
+            if depth is None or overlap < depth:
+                depth, direction = overlap, axis
+
+    if depth is None:
+        return 0., P2[0], P2[0]
+    Q2 = min(P2, key=lambda p: p.dot(direction))
+    return depth, Q2 + direction * depth, Q2
+
+def triangle_distance(P1, P2):
+    """
+    Signed distance between two triangles, negative when they intersect (minus the penetration depth).
+    Returns (distance, Q1, Q2) with Q1 on P1 and Q2 on P2 the witness points
+    """
+    if triangle_intersection(P1, P2):
+        depth, Q1, Q2 = triangle_penetration(P1, P2)
+        return -depth, Q1, Q2
+
+    # disjoint triangles: the closest points are a vertex of one and a point of an edge of the other
+    best = (np.inf, None, None)
+    for p in P1:
+        for i in range(3):
+            q = closest_point_on_segment(p, P2[i], P2[(i + 1) % 3])
+            d = abs(q - p)
+            if d < best[0]:
+                best = (d, p, q)
+    for p in P2:
+        for i in range(3):
+            q = closest_point_on_segment(p, P1[i], P1[(i + 1) % 3])
+            d = abs(q - p)
+            if d < best[0]:
+                best = (d, q, p)
+    return best
+
+def triangle_intersection_segments(P1, P2):
+    # edge / edge intersections, then containment of a triangle in the other (reference for triangle_intersection_sat)
     flag =         segment_intersection(P1[0], P1[1], P2[0], P2[1])
     flag = flag or segment_intersection(P1[0], P1[1], P2[1], P2[2])
     flag = flag or segment_intersection(P1[0], P1[1], P2[2], P2[0])
@@ -42,12 +124,56 @@ def triangle_intersection(P1, P2):
     
     return flag
 
+def triangle_bounding_box(triangle):
+    """
+    Returns the axis aligned bounding box of the triangle as (min_x, min_y, max_x, max_y)
+    """
+    A, B, C = triangle
+    return (min(A.x, B.x, C.x), min(A.y, B.y, C.y), max(A.x, B.x, C.x), max(A.y, B.y, C.y))
+
+def merge_bounding_boxes(boxes):
+    if len(boxes) == 0:
+        return None
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+def boxes_overlap(box1, box2):
+    # touching boxes overlap, as touching triangles intersect
+    return box1[0] <= box2[2] and box2[0] <= box1[2] and box1[1] <= box2[3] and box2[1] <= box1[3]
+
+def box_distance(box1, box2):
+    """
+    Distance between two axis aligned boxes, 0 when they overlap. Lower bound of the distance between their contents
+    """
+    dx = max(0., box2[0] - box1[2], box1[0] - box2[2])
+    dy = max(0., box2[1] - box1[3], box1[1] - box2[3])
+    return np.sqrt(dx * dx + dy * dy)
+
+def segment_box_overlap(P1, P2, box):
+    """
+    True when the segment [P1, P2] crosses (or touches) the box (min_x, min_y, max_x, max_y), using the slab method
+    """
+    t_min, t_max = 0., 1.
+    for start, d, low, high in ((P1.x, P2.x - P1.x, box[0], box[2]), (P1.y, P2.y - P1.y, box[1], box[3])):
+        if d == 0:
+            if start < low or start > high:
+                return False
+            continue
+        t_low = (low - start) / d
+        t_high = (high - start) / d
+        if t_low > t_high:
+            t_low, t_high = t_high, t_low
+        t_min = max(t_min, t_low)
+        t_max = min(t_max, t_high)
+        if t_min > t_max:
+            return False
+    return True
+
 def point_in_triangle(point: V, triangle: list[V]):
     v0 = triangle[2] - triangle[0]
     v1 = triangle[1] - triangle[0]
     v2 = point - triangle[0]
 
-    u = v0.cross(v1)
+    u = v2.cross(v0)
     v = v1.cross(v2)
     d = v1.cross(v0)
 
@@ -67,8 +193,13 @@ def segment_intersection(P1, P2, P3, P4):
 
     r_cross_s = r.cross(s)
     if (r_cross_s == 0):
-        # the two lines are collinear
-        return (q-p).cross(r) == 0 # true if the lines share a segment, false otherwise (collinear but not intersection)
+        # the two lines are parallel
+        if (q-p).cross(r) != 0:
+            return False
+        # collinear: true if the segments share a part, ie if [P3, P4] projected on r overlaps [0, |r|²]
+        a = (q-p).dot(r)
+        b = (P4-p).dot(r)
+        return max(a, b) >= 0 and min(a, b) <= r.dot(r)
     # else
     t = (q-p).cross(s) / r_cross_s
     u = (q-p).cross(r) / r_cross_s
@@ -76,42 +207,87 @@ def segment_intersection(P1, P2, P3, P4):
     
     return 0 <= t and t <= 1 and 0 <= u and u <= 1
 
+ORIENTATION_ERROR_BOUND = 3.3306690738754716e-16 # relative error of the float orientation determinant (Shewchuk's ccwerrboundA)
+IN_CIRCLE_ERROR_BOUND = 1.1102230246251577e-15 # relative error of the float in-circle determinant (Shewchuk's iccerrboundA)
+
+def orientation(A, B, C):
+    """
+    > 0 when A, B, C turn counterclockwise, < 0 clockwise, 0 when they are aligned.
+    The sign is exact: when the float determinant is too small to be trusted, it is computed again with fractions
+    """
+    left = (B.x - A.x) * (C.y - A.y)
+    right = (B.y - A.y) * (C.x - A.x)
+    det = left - right
+    if abs(det) > ORIENTATION_ERROR_BOUND * (abs(left) + abs(right)):
+        return det
+    ax, ay, bx, by, cx, cy = map(Fraction, (A.x, A.y, B.x, B.y, C.x, C.y))
+    exact = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+    return (exact > 0) - (exact < 0)
+
+def circumcircle(triangle):
+    """
+    Circumcircle of a triangle in closed form, computed relatively to the vertex opposite to its longest edge
+    (the smallest coordinates, the best precision). Returns (cx, cy, r2): center and squared radius.
+    A flat triangle has an infinite circle
+    """
+    A, B, C = triangle
+    ab, bc, ca = (B - A).mag_sqr(), (C - B).mag_sqr(), (A - C).mag_sqr()
+    if ab >= bc and ab >= ca:
+        A, B, C = C, A, B
+    elif bc >= ca:
+        pass
+    else:
+        A, B, C = B, C, A
+    bx, by = B.x - A.x, B.y - A.y
+    cx, cy = C.x - A.x, C.y - A.y
+    d = 2 * (bx * cy - by * cx)
+    if d == 0:
+        return A.x, A.y, float('inf')
+    b2 = bx * bx + by * by
+    c2 = cx * cx + cy * cy
+    ux = (cy * b2 - by * c2) / d
+    uy = (bx * c2 - cx * b2) / d
+    return A.x + ux, A.y + uy, ux * ux + uy * uy
+
+def in_circumcircle(point, triangle):
+    """
+    Robust in-circle predicate: 1 when the point is inside the circumcircle of the triangle, 0 on it, -1 outside.
+    The sign is exact: the float determinant decides when it is larger than its error bound
+    (IN_CIRCLE_ERROR_BOUND times the permanent), else it is computed again with fractions.
+    A flat triangle contains every point
+    """
+    A, B, C = triangle
+    turn = orientation(A, B, C)
+    if turn == 0:
+        return 1
+
+    adx, ady = A.x - point.x, A.y - point.y
+    bdx, bdy = B.x - point.x, B.y - point.y
+    cdx, cdy = C.x - point.x, C.y - point.y
+    bdxcdy, cdxbdy = bdx * cdy, cdx * bdy
+    cdxady, adxcdy = cdx * ady, adx * cdy
+    adxbdy, bdxady = adx * bdy, bdx * ady
+    alift = adx * adx + ady * ady
+    blift = bdx * bdx + bdy * bdy
+    clift = cdx * cdx + cdy * cdy
+    det = alift * (bdxcdy - cdxbdy) + blift * (cdxady - adxcdy) + clift * (adxbdy - bdxady)
+    permanent = (abs(bdxcdy) + abs(cdxbdy)) * alift + (abs(cdxady) + abs(adxcdy)) * blift + (abs(adxbdy) + abs(bdxady)) * clift
+    if abs(det) <= IN_CIRCLE_ERROR_BOUND * permanent:
+        px, py = Fraction(point.x), Fraction(point.y)
+        (ax, ay), (bx, by), (cx, cy) = [(Fraction(v.x) - px, Fraction(v.y) - py) for v in triangle]
+        det = (ax * ax + ay * ay) * (bx * cy - cx * by) \
+            + (bx * bx + by * by) * (cx * ay - ax * cy) \
+            + (cx * cx + cy * cy) * (ax * by - bx * ay)
+    if turn < 0:
+        det = -det
+    return (det > 0) - (det < 0)
+
 def make_circumcircle(R):
     if len(R) == 3:
-        A, B, C = R
-
-        Sx = 1/2 * np.linalg.det(np.array([
-            [A.mag_sqr(), A.y, 1],
-            [B.mag_sqr(), B.y, 1],
-            [C.mag_sqr(), C.y, 1]
-        ]))
-
-        Sy = 1/2 * np.linalg.det(np.array([
-            [A.x, A.mag_sqr(), 1],
-            [B.x, B.mag_sqr(), 1],
-            [C.x, C.mag_sqr(), 1]
-        ]))
-        S = V(Sx, Sy)
-
-        a = np.linalg.det(np.array([
-            [A.x, A.y, 1],
-            [B.x, B.y, 1],
-            [C.x, C.y, 1]
-        ]))
-
-        b = np.linalg.det(np.array([
-            [A.x, A.y, A.mag_sqr()],
-            [B.x, B.y, B.mag_sqr()],
-            [C.x, C.y, C.mag_sqr()]
-        ]))
-
-        center = V(S / a)
-        radius = np.sqrt(b/a + S.mag_sqr() / (a ** 2))
+        cx, cy, r2 = circumcircle(R)
+        return V(cx, cy), np.sqrt(r2)
 
-        return center, radius
-
-
-    elif len(R) == 0:
+    if len(R) == 0:
         return V(0,0), 0.
     elif len(R) == 1:
         return R[0], 0.
@@ -123,44 +299,52 @@ def make_circumcircle(R):
 def find_circle_containing_points(points):
     return welzl(points, [])
     
-def point_inside_circumcircle(point, triangle):
-    center, radius = make_circumcircle(triangle)
-    return (point - center).mag_sqr() <= (radius) ** 2
-
-def make_polygon_from_triangles(triangles):
-    edges_appearing_once = set()
-    edges_multiples = set()
-    for triangle in triangles:
-        for edge in triangle_edges(triangle):
-            if edge not in edges_appearing_once and edge[::-1] not in edges_appearing_once and edge not in edges_multiples and edge[::-1] not in edges_multiples:
-                edges_appearing_once.add(edge)
-            elif edge in edges_appearing_once or edge[::-1] in edges_appearing_once:
-                if edge in edges_appearing_once:
-                    edges_appearing_once.remove(edge)
-                else:
-                    edges_appearing_once.remove(edge[::-1])
-                edges_multiples.add(edge)
-                
-    if len(edges_appearing_once) > 0:
-        edge = edges_appearing_once.pop()
-        polygon = [*edge]
-
-        while len(edges_appearing_once) != 1:
-            # find the next edge to attach
-            for other_edge in edges_appearing_once:
-                if other_edge[0] == polygon[-1]:
-                    polygon.append(other_edge[1])
-                    edges_appearing_once.remove(other_edge)
-                    break
-                elif other_edge[1] == polygon[-1]:
-                    polygon.append(other_edge[0])
-                    edges_appearing_once.remove(other_edge)
-                    break
-    
-        return polygon
-    else:
-        return []
-
+def boundary_loops(vertices, triangles, edges=None):
+    """
+    Boundary of a mesh of counterclockwise triangles, in linear time: the boundary edges are the directed edges
+    without a twin, each one is followed by the next boundary edge found by turning around its end vertex
+    (so that loops touching at a vertex stay separate).
+    Arguments:
+        vertices: np.array (N, 2)
+        triangles: np.array (T, 3) of vertex indices
+        edges: dict (i, j) -> row of the triangle with the directed edge i -> j, built when not given
+    Returns:
+        list of loops (lists of vertex indices), sorted by decreasing signed area: the outer rings are
+        counterclockwise (positive area) and come first, the largest one first, the holes are clockwise
+    """
+    triangles = np.asarray(triangles).tolist()
+    if edges is None:
+        edges = {}
+        for row, (i, j, k) in enumerate(triangles):
+            edges[(i, j)] = edges[(j, k)] = edges[(k, i)] = row
+
+    def after(row, v):
+        i, j, k = triangles[row]
+        return j if i == v else k if j == v else i
+
+    def next_boundary_edge(a, v):
+        # turns around v, from the triangle of a -> v, across the inner edges until the boundary
+        w = after(edges[(a, v)], v)
+        while (w, v) in edges:
+            w = after(edges[(w, v)], v)
+        return v, w
+
+    visited = set()
+    loops = []
+    for edge in edges:
+        if edge in visited or edge[::-1] in edges:
+            continue
+        loop = []
+        while edge not in visited:
+            visited.add(edge)
+            loop.append(edge[0])
+            edge = next_boundary_edge(*edge)
+        loops.append(loop)
+
+    def area(loop):
+        x, y = vertices[loop, 0], vertices[loop, 1]
+        return float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)) / 2
+    return sorted(loops, key=area, reverse=True)
 
 def triangle_edges(triangle):
     A, B, C = triangle
@@ -170,13 +354,6 @@ def triangle_edges(triangle):
         (C, A)
     ]
 
-def edge_in_triangles(edge, triangles):
-    for triangle in triangles:
-        for other_edge in triangle_edges(triangle):
-            if edge == other_edge or edge == other_edge[::-1]:
-                return True
-    return False
-
 def equilateral_triangle_enclosing_circle(center: V, radius: float):
     a = 2 * radius
 
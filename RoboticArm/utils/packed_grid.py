@@ -0,0 +1,107 @@
+import numpy as np
+
+
+class PackedBoolGrid:
+    """
+    2D array of booleans, stored with 8 cells per byte (np.packbits along the rows).
+    Indexing works like a numpy array and returns booleans / arrays of booleans:
+        grid[i, j], grid[i], grid[i0:i1, j0:j1], grid[rows_array, j]...
+    and two arrays of indices are paired like numpy's fancy indexing: grid[rows_array, cols_array]
+    """
+    def __init__(self, shape, packed=None):
+        self.shape = (int(shape[0]), int(shape[1]))
+        if packed is None:
+            packed = np.zeros(shape=(self.shape[0], self.row_bytes(self.shape[1])), dtype=np.uint8)
+        self.packed = packed
+
+    @staticmethod
+    def row_bytes(num_columns):
+        return (num_columns + 7) // 8
+
+    @staticmethod
+    def from_array(array):
+        array = np.asarray(array)
+        return PackedBoolGrid(array.shape, np.packbits(array.astype(bool), axis=1))
+
+    def to_array(self):
+        return np.unpackbits(self.packed, axis=1, count=self.shape[1]).astype(bool)
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.to_array()
+        return array if dtype is None else array.astype(dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.packed.nbytes
+
+    def count(self):
+        """
+        Number of cells set to True
+        """
+        return int(np.unpackbits(self.packed).sum())
+
+    def _split_key(self, key):
+        if isinstance(key, tuple):
+            if len(key) != 2:
+                raise IndexError(f"PackedBoolGrid is 2D, got {len(key)} indices")
+            return key
+        return key, slice(None)
+
+    def _paired_indices(self, rows, cols):
+        """
+        Broadcast (rows, cols) arrays of the cells when the key is paired fancy indexing, None otherwise
+        """
+        if isinstance(rows, slice) or isinstance(cols, slice) or np.ndim(cols) == 0:
+            return None
+        indices = []
+        for index, size in ((rows, self.shape[0]), (cols, self.shape[1])):
+            index = np.asarray(index)
+            if index.dtype == bool:
+                index = np.flatnonzero(index)
+            index = np.where(index < 0, index + size, index)
+            if np.any((index < 0) | (index >= size)):
+                raise IndexError(f"index out of range for an axis of size {size}")
+            indices.append(index)
+        return np.broadcast_arrays(*indices)
+
+    def __getitem__(self, key):
+        rows, cols = self._split_key(key)
+        paired = self._paired_indices(rows, cols)
+        if paired is not None:
+            rows, cols = paired
+            return ((self.packed[rows, cols // 8] >> (7 - cols % 8)) & 1).astype(bool)
+        packed_rows = self.packed[rows]
+
+        if isinstance(cols, (int, np.integer)):
+            col = cols + self.shape[1] if cols < 0 else cols
+            if not 0 <= col < self.shape[1]:
+                raise IndexError(f"column {cols} out of range for {self.shape[1]} columns")
+            return ((packed_rows[..., col // 8] >> (7 - col % 8)) & 1).astype(bool)
+
+        if isinstance(cols, slice) and cols.step in (None, 1):
+            # only unpack the bytes covering the columns
+            start, stop, _ = cols.indices(self.shape[1])
+            stop = max(start, stop)
+            first_byte = start // 8
+            bits = np.unpackbits(packed_rows[..., first_byte:self.row_bytes(stop)], axis=-1)
+            return bits[..., start - 8 * first_byte:stop - 8 * first_byte].astype(bool)
+
+        return np.unpackbits(packed_rows, axis=-1, count=self.shape[1])[..., cols].astype(bool)
+
+    def __setitem__(self, key, value):
+        rows, cols = self._split_key(key)
+        paired = self._paired_indices(rows, cols)
+        if paired is not None:
+            rows, cols = paired
+            masks = (1 << (7 - cols % 8)).astype(np.uint8)
+            values = np.broadcast_to(np.asarray(value, dtype=bool), rows.shape)
+            np.bitwise_and.at(self.packed, (rows, cols // 8), ~masks)
+            np.bitwise_or.at(self.packed, (rows, cols // 8), masks * values)
+            return
+        row_indices = np.arange(self.shape[0])[rows]
+        bits = np.unpackbits(self.packed[row_indices], axis=-1, count=self.shape[1])
+        bits[..., cols] = np.asarray(value, dtype=bool)
+        self.packed[row_indices] = np.packbits(bits, axis=-1)
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+from lib.Math.Vector import Vector2 as V
+
+from RoboticArm.utils.bvh import BVH
+from RoboticArm.ObstaclesManager import ObstaclesManager
+
+OBSTACLES_PATH = os.path.join(os.path.dirname(__file__), "..", "obstacles", "difficult.obstacles")
+
+
+def segment_crosses_box(P1, P2, box):
+    """
+    Brute force reference: separating axis test between the segment and the box, on the x and y axes
+    and on the normal of the segment (exact for integer coordinates)
+    """
+    min_x, min_y, max_x, max_y = box
+    if max(P1.x, P2.x) < min_x or min(P1.x, P2.x) > max_x or max(P1.y, P2.y) < min_y or min(P1.y, P2.y) > max_y:
+        return False
+    sides = [(P2.x - P1.x) * (y - P1.y) - (P2.y - P1.y) * (x - P1.x) for x, y in ((min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y))]
+    return not (all(side > 0 for side in sides) or all(side < 0 for side in sides))
+
+
+def random_segments(rng, num, low, high, integer):
+    ends = rng.integers(low, high, (num, 2, 2)) if integer else rng.uniform(low, high, (num, 2, 2))
+    ends[::10, 1] = ends[::10, 0] # some segments reduced to a point
+    ends[1::10, 1, 0] = ends[1::10, 0, 0] # vertical ones
+    ends[2::10, 1, 1] = ends[2::10, 0, 1] # horizontal ones
+    return [(V(float(a), float(b)), V(float(c), float(d))) for (a, b), (c, d) in ends]
+
+
+def test_query_segment_matches_brute_force():
+    rng = np.random.default_rng(0)
+    for integer in (True, False):
+        corners = rng.integers(0, 20, (300, 2, 2)) if integer else rng.uniform(0, 20, (300, 2, 2))
+        boxes = np.concatenate([corners.min(axis=1), corners.max(axis=1)], axis=1).astype(float)
+        bvh = BVH(boxes)
+        for P1, P2 in random_segments(rng, 500, -2, 22, integer):
+            expected = [i for i, box in enumerate(boxes.tolist()) if segment_crosses_box(P1, P2, box)]
+            assert sorted(bvh.query_segment(P1, P2)) == expected
+
+
+def test_manager_query_segment():
+    obstacles = ObstaclesManager()
+    obstacles.load_from_json(OBSTACLES_PATH)
+    triangles = obstacles.get_triangles_array()
+    boxes = np.concatenate([triangles.min(axis=1), triangles.max(axis=1)], axis=1).tolist()
+    lower, upper = triangles.min(), triangles.max()
+    rng = np.random.default_rng(1)
+    found = 0
+    for P1, P2 in random_segments(rng, 300, lower, upper, False):
+        expected = [i for i, box in enumerate(boxes) if segment_crosses_box(P1, P2, box)]
+        assert sorted(obstacles.query_segment(P1, P2)) == expected
+        found += len(expected) > 0
+    assert found > 0
@@ -0,0 +1,66 @@
+import math
+from fractions import Fraction
+
+import numpy as np
+from lib.Math.Vector import Vector2 as V
+
+from RoboticArm.utils.mesh_generation import in_circumcircle
+
+
+def exact_in_circle(point, triangle):
+    """
+    Reference sign with fractions: 1 inside the circumcircle, 0 on it, -1 outside (a flat triangle contains every point)
+    """
+    (ax, ay), (bx, by), (cx, cy) = [(Fraction(v.x) - Fraction(point.x), Fraction(v.y) - Fraction(point.y)) for v in triangle]
+    turn = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+    if turn == 0:
+        return 1
+    det = (ax * ax + ay * ay) * (bx * cy - cx * by) + (bx * bx + by * by) * (cx * ay - ax * cy) + (cx * cx + cy * cy) * (ax * by - bx * ay)
+    det = det if turn > 0 else -det
+    return (det > 0) - (det < 0)
+
+
+def sliver_cases(rng, thickness, num):
+    """
+    Sliver triangles (height `thickness` relative to their longest edge), randomly placed, and points at a relative
+    distance of 1e-9 to 1e-5 from their circumcircle, inside or outside
+    """
+    for _ in range(num):
+        scale = 10 ** rng.uniform(-2, 3)
+        angle = rng.uniform(0, 2 * math.pi)
+        offset = rng.uniform(-100, 100, 2)
+        u = rng.uniform(0.1, 0.9)
+        local = np.array([[0., 0.], [1., 0.], [u, thickness * rng.choice([-1, 1])]]) * scale
+        rotation = np.array([[math.cos(angle), -math.sin(angle)], [math.sin(angle), math.cos(angle)]])
+        corners = local @ rotation.T + offset
+        triangle = [V(float(x), float(y)) for x, y in corners]
+
+        # circumcircle in extended precision, from the float corners
+        (ax, ay), (bx, by), (cx, cy) = [(Fraction(v.x), Fraction(v.y)) for v in triangle]
+        d = 2 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+        ux = ((ax * ax + ay * ay) * (by - cy) + (bx * bx + by * by) * (cy - ay) + (cx * cx + cy * cy) * (ay - by)) / d
+        uy = ((ax * ax + ay * ay) * (cx - bx) + (bx * bx + by * by) * (ax - cx) + (cx * cx + cy * cy) * (bx - ax)) / d
+        radius = math.sqrt((ax - ux) ** 2 + (ay - uy) ** 2)
+        theta = rng.uniform(0, 2 * math.pi)
+        distance = radius * (1 + float(rng.choice([-1, 1]) * 10 ** rng.uniform(-9, -5)))
+        yield V(float(ux) + distance * math.cos(theta), float(uy) + distance * math.sin(theta)), triangle
+
+
+def test_in_circumcircle_is_exact_on_slivers():
+    rng = np.random.default_rng(0)
+    for thickness in (1e-10, 1e-8, 1e-6):
+        signs = []
+        for point, triangle in sliver_cases(rng, thickness, 2000):
+            expected = exact_in_circle(point, triangle)
+            assert in_circumcircle(point, triangle) == expected
+            assert in_circumcircle(point, triangle[::-1]) == expected
+            signs.append(expected)
+        assert 1 in signs and -1 in signs
+
+
+def test_in_circumcircle_cocircular_and_flat():
+    square = [V(0., 0.), V(1., 0.), V(1., 1.)]
+    assert in_circumcircle(V(0., 1.), square) == 0
+    assert in_circumcircle(V(0.5, 0.5), square) == 1
+    assert in_circumcircle(V(2., 2.), square) == -1
+    assert in_circumcircle(V(5., 5.), [V(0., 0.), V(1., 1.), V(2., 2.)]) == 1
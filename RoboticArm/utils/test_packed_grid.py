@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from RoboticArm.utils.packed_grid import PackedBoolGrid
+
+
+def test_indexing_matches_numpy():
+    rng = np.random.default_rng(0)
+    array = rng.random((37, 29)) < 0.4
+    grid = PackedBoolGrid.from_array(array)
+    rows = rng.integers(-37, 37, 50)
+    cols = rng.integers(-29, 29, 50)
+    keys = [
+        (rows, cols), (rows[:, None], cols[None, :10]), (rows[0], cols), (rows, cols[0]), (rows.reshape(5, 10), cols[:10]),
+        (np.arange(37) < 5, np.arange(29) % 6 == 0), (3, 5), (-1, -1), 4, (slice(2, 30), slice(3, 20)), (slice(None), cols), (rows, slice(None, None, 2)),
+    ]
+    for key in keys:
+        assert np.array_equal(grid[key], array[key])
+
+    with pytest.raises(IndexError):
+        grid[rows, np.array([0, 29] * 25)]
+
+
+def test_paired_assignment_matches_numpy():
+    rng = np.random.default_rng(1)
+    array = rng.random((20, 19)) < 0.5
+    grid = PackedBoolGrid.from_array(array)
+    for _ in range(20):
+        rows, cols = rng.integers(0, 20, 30), rng.integers(-19, 19, 30)
+        _, first = np.unique(np.stack([rows, cols % 19]), axis=1, return_index=True) # numpy keeps one of repeated cells
+        rows, cols = rows[first], cols[first]
+        values = rng.random(len(rows)) < 0.5
+        array[rows, cols] = values
+        grid[rows, cols] = values
+        assert np.array_equal(grid.to_array(), array)
+
+    array[[1, 2], [3, 4]] = True
+    grid[[1, 2], [3, 4]] = True
+    assert np.array_equal(grid.to_array(), array)
@@ -0,0 +1,55 @@
+import itertools
+
+import numpy as np
+from lib.Math.Vector import Vector2 as V
+
+from RoboticArm.utils.mesh_generation import triangle_intersection_segments, triangle_intersection_sat
+from RoboticArm.utils.cspace_engine import triangle_intersection_sat_batch, triangle_pairs_intersection_sat_batch
+
+
+def make_corpus(seed=0, num_random=5000, num_grid=20000):
+    """
+    Regression corpus of triangle pairs np.array (P, 2, 3, 2): random triangles, and triangles on a small integer grid,
+    where the pairs often share vertices, touch along collinear edges or have a vertex on the edge of the other
+    (exact in floating point). Flat triangles are left out, the separating axis test assumes a non zero area
+    """
+    rng = np.random.default_rng(seed)
+    random_pairs = rng.uniform(0, 10, (num_random, 2, 3, 2))
+    grid_pairs = rng.integers(0, 4, (num_grid, 2, 3, 2)).astype(float)
+    pairs = np.concatenate([random_pairs, grid_pairs])
+
+    AB = pairs[..., 1, :] - pairs[..., 0, :]
+    AC = pairs[..., 2, :] - pairs[..., 0, :]
+    area = AB[..., 0] * AC[..., 1] - AB[..., 1] * AC[..., 0]
+    return pairs[(area != 0).all(axis=-1)]
+
+
+def to_vectors(triangle):
+    return [V(float(x), float(y)) for x, y in triangle]
+
+
+def test_corpus_has_touching_and_collinear_cases():
+    pairs = make_corpus()
+    grid = pairs[(pairs == np.round(pairs)).all(axis=(1, 2, 3))]
+    shared_vertex = [any((a == b).all() for a, b in itertools.product(P1, P2)) for P1, P2 in grid[:2000]]
+    assert len(grid) > 10000
+    assert np.mean(shared_vertex) > 0.2
+
+
+def test_sat_agrees_with_segments():
+    for P1, P2 in make_corpus():
+        T1, T2 = to_vectors(P1), to_vectors(P2)
+        assert triangle_intersection_sat(T1, T2) == triangle_intersection_segments(T1, T2), (P1.tolist(), P2.tolist())
+
+
+def test_batches_agree_with_scalar():
+    pairs = make_corpus()
+    expected = np.array([triangle_intersection_sat(to_vectors(P1), to_vectors(P2)) for P1, P2 in pairs])
+    assert expected.any() and not expected.all()
+
+    assert (triangle_pairs_intersection_sat_batch(pairs[:, 0], pairs[:, 1]) == expected).all()
+    for k in range(0, len(pairs), 997):
+        # one triangle against all the others
+        others = triangle_pairs_intersection_sat_batch(pairs[k, 0], pairs[:, 1])
+        assert (triangle_intersection_sat_batch(pairs[k, 0], pairs[:, 1]) == others).all()
+        assert others[k] == expected[k]